@@ -0,0 +1,153 @@
+"""
+Approximate a whole directory (or manifest) of reference images, one genetic_algorithm run per image.
+
+Usage: python batch.py INPUT OUTPUT [--workers N] [--generations N] [--time-budget SECONDS] ...
+
+INPUT is either a directory of images or a manifest file listing one image path per line
+(relative to the manifest, empty lines and lines starting with # are ignored). For every image,
+OUTPUT receives <name>.json with the best gene and <name>.png with its render, where <name> is the
+file name without extension, suffixed with the input index when another image already uses it.
+"""
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import replace
+from pathlib import Path
+import numpy as np
+from genetic.genetic import GeneticAlgorithmConfig, genetic_algorithm
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp"}
+
+def list_images(input_path: Path) -> list[Path]:
+    if input_path.is_dir():
+        return sorted(path for path in input_path.iterdir() if path.suffix.lower() in IMAGE_EXTENSIONS)
+    lines = input_path.read_text().splitlines()
+    return [input_path.parent / line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+
+def image_pixels(path: Path, max_pixels: int) -> int:
+    """
+    Pixel count of an image after downscaling, 0 if it can not be read (its job reports the error).
+    """
+    from PIL import Image
+    try:
+        with Image.open(path) as img:  # only reads the header
+            return min(img.width * img.height, max_pixels)
+    except Exception:
+        return 0
+
+def output_names(image_paths: list[Path]) -> list[str]:
+    """
+    Unique output names, the file name without extension, suffixed with the input index if it is taken.
+    """
+    names, used = [], set()
+    for index, path in enumerate(image_paths):
+        name = path.stem
+        while name in used:
+            name = f"{name}-{index}"
+        used.add(name)
+        names.append(name)
+    return names
+
+def load_reference_image(path: Path, max_pixels: int) -> np.ndarray:
+    """
+    Load an RGB image as floats in [0, 1], downscaled to at most max_pixels like the GUI does.
+    """
+    from PIL import Image
+    img = Image.open(path).convert('RGB')
+    w, h = img.size
+    if w * h > max_pixels:
+        ratio = math.sqrt(max_pixels / (w * h))
+        img = img.resize((max(1, int(w * ratio)), max(1, int(h * ratio))))
+    return np.array(img).astype(float) / 255.0
+
+def run_job(image_path: Path, output_dir: Path, name: str, config: GeneticAlgorithmConfig, max_pixels: int) -> dict:
+    """
+    Run one image until one of the stop criteria of the config is met, then write its best gene and render.
+    """
+    from PIL import Image
+
+    start = time.perf_counter()
+    reference_image = load_reference_image(image_path, max_pixels)
+    best = None
+    # the initial population is yielded as generation 0
+    for generations, population in enumerate(genetic_algorithm(reference_image, config)):
+        current_best = max(population, key=lambda x: x.fitness)
+        if best is None or current_best.fitness > best.fitness:
+            best = current_best
+    stop_reason = population.stop_reason
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "image": str(image_path),
+        "output": name,
+        "fitness": best.fitness,
+        "generations": generations,
+        "elapsed": elapsed,
+        "stop_reason": stop_reason,
+        "polygons": best.full_gene().polygons,
+        "colors": best.full_gene().colors,
+    }
+    (output_dir / f"{name}.json").write_text(json.dumps(result))
+    Image.fromarray((np.clip(best.render, 0, 1) * 255).round().astype(np.uint8)).save(output_dir / f"{name}.png")
+    return {key: value for key, value in result.items() if key not in ("polygons", "colors")}
+
+def run_batch(image_paths: list[Path], output_dir: Path, config: GeneticAlgorithmConfig, workers: int, max_pixels: int) -> list[dict]:
+    """
+    Run every image in a pool of `workers` processes. Jobs are submitted largest image first, so the
+    long runs start early and the small ones fill the slots freed by finished jobs.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    # Seeds and names are assigned in input order, so results do not depend on the scheduling
+    jobs = list(zip(image_paths, output_names(image_paths), config.spawn(len(image_paths))))
+    jobs.sort(key=lambda job: image_pixels(job[0], max_pixels), reverse=True)
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_job, path, output_dir, name, job_config, max_pixels): path for path, name, job_config in jobs}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as error:
+                result = {"image": str(path), "error": repr(error)}
+                print(f"{path}: failed with {error!r}")
+            else:
+                print(f"{path}: fitness {result['fitness']:.4f} after {result['generations']} generations in {result['elapsed']:.1f}s ({result['stop_reason']})")
+            results.append(result)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Approximate a directory or manifest of images with polygons.")
+    parser.add_argument("input", type=Path, help="directory of images or manifest file")
+    parser.add_argument("output", type=Path, help="output directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of concurrent jobs")
+    parser.add_argument("--generations", type=int, default=None, help="generation budget per job")
+    parser.add_argument("--time-budget", type=float, default=None, help="wall-clock budget per job in seconds")
+    parser.add_argument("--target-fitness", type=float, default=None, help="stop a job once its best fitness reaches this")
+    parser.add_argument("--plateau-patience", type=int, default=None, help="stop a job after this many generations without improvement")
+    parser.add_argument("--population-size", type=int, default=None)
+    parser.add_argument("--engine", choices=["generational", "hill_climbing", "layered", "steady_state"], default=None)
+    parser.add_argument("--seed", type=int, default=None, help="seed of the whole batch, for reproducible runs")
+    parser.add_argument("--max-pixels", type=int, default=10000, help="downscale larger images to this many pixels")
+    args = parser.parse_args()
+
+    overrides = {
+        "generations": args.generations,
+        "population_size": args.population_size,
+        "engine": args.engine,
+        "seed": args.seed,
+        "time_budget": args.time_budget,
+        "target_fitness": args.target_fitness,
+        "plateau_patience": args.plateau_patience,
+    }
+    config = replace(GeneticAlgorithmConfig.DEFAULT_CONFIG, **{key: value for key, value in overrides.items() if value is not None})
+
+    image_paths = list_images(args.input)
+    print(f"Approximating {len(image_paths)} images with {args.workers} workers")
+    results = run_batch(image_paths, args.output, config, args.workers, args.max_pixels)
+    (args.output / "summary.json").write_text(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Import-time benchmark for the core packages.
+
+Every module is imported in a fresh interpreter, several times, and the fastest import is compared
+with the budget. The core packages must also import without any of the heavy optional dependencies,
+which are only needed by the GUI and by demos.
+
+Usage: python benchmark_imports.py [budget_in_seconds]
+"""
+import subprocess
+import sys
+
+CORE_MODULES = ["scanline", "image_similarity", "environment", "rasterizer", "genetic.genetic", "genetic.hill_climbing"]
+HEAVY_MODULES = ["matplotlib", "PySide6", "PIL", "numba"]
+DEFAULT_BUDGET = 0.5 # seconds, numpy alone takes about 0.1
+REPEAT = 5
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(",".join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+def measure_import(module: str) -> tuple[float, list[str]]:
+    """
+    Return the fastest import time of a module over REPEAT fresh interpreters, and the heavy modules it pulled in.
+    """
+    best = float('inf')
+    for _ in range(REPEAT):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            capture_output=True, text=True, check=True,
+        ).stdout.splitlines()
+        best = min(best, float(output[0]))
+        heavy = [name for name in output[1].split(",") if name]
+    return best, heavy
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BUDGET
+    failed = False
+    for module in CORE_MODULES:
+        elapsed, heavy = measure_import(module)
+        status = "ok"
+        if heavy:
+            status = f"FAIL imports {', '.join(heavy)}"
+            failed = True
+        elif elapsed > budget:
+            status = f"FAIL over budget of {budget:.3f}s"
+            failed = True
+        print(f"{module:<24} {elapsed:.3f}s  {status}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,382 @@
-from scanline import Polygon, SampleOffset2D, FillRule, render_polygons
+from scanline import Polygon, SampleOffset2D, FillRule, PolygonCoverage, blend_coverage, check_normalized
+from rasterizer import CoverageCache, coverage_at, get_backend, polygon_coverage, sample_coverage
 import numpy as np
-from image_similarity import similarity_score
+import weakref
+from image_similarity import similarity_score, batch_similarity_score, squared_error
 
 class PolygonEnvironmentConfig:
-    def __init__(self, sample_offset: SampleOffset2D, fill_rule: FillRule, similarity_measure: str):
+    def __init__(self, sample_offset: SampleOffset2D, fill_rule: FillRule, similarity_measure: str, coverage_cache_bytes: int = 64 * 2**20, rasterizer: str = "scanline",
+                 sample_fraction: float | None = None, sample_strategy: str = "random", resample_every: int = 0):
         self.sample_offset = sample_offset
         self.fill_rule = fill_rule
         self.similarity_measure = similarity_measure
+        self.rasterizer = rasterizer # name of a backend registered in rasterizer.RASTERIZER_BACKENDS, "fixed_point" also keeps genes quantized
+        self.coverage_cache_bytes = coverage_cache_bytes # 0 disables the per-polygon coverage cache
+        # estimate the fitness from this fraction of the pixels for selection, None scores every pixel
+        self.sample_fraction = sample_fraction
+        self.sample_strategy = sample_strategy # "random" pixels or "stratified", one per cell of a grid
+        self.resample_every = resample_every # batches between drawing new samples, 0 keeps a fixed subset
+
+class CanvasPool:
+    """
+    Free list of reusable canvases of one shape and dtype.
+
+    `acquire` hands out a lease: a view of a pooled buffer, which goes back to the pool once the
+    lease is garbage collected, e.g. when the GeneInfo holding it as render is dropped. Keep the
+    lease itself (not a slice of it) for as long as the data is needed, or copy it.
+    """
+    def __init__(self, shape: tuple, dtype: np.dtype, max_free: int = 256):
+        self.shape = shape
+        self.dtype = dtype
+        self.max_free = max_free
+        self.free = []
+        self.allocated = 0
+
+    def acquire(self) -> np.ndarray:
+        if self.free:
+            buffer = self.free.pop()
+        else:
+            buffer = np.empty(self.shape, dtype=self.dtype)
+            self.allocated += 1
+        lease = buffer.view()
+        weakref.finalize(lease, self._release, buffer)
+        return lease
+
+    def _release(self, buffer: np.ndarray):
+        if len(self.free) < self.max_free:
+            self.free.append(buffer)
+
+    def statistics(self) -> dict:
+        return {"allocated": self.allocated, "free": len(self.free)}
 
 class PolygonEnvironment:
     def __init__(self, config: PolygonEnvironmentConfig):
         self.reference_image = None
         self.config = config
         self.similarity_score = 0
+        self.canvas_stack = None
+        self.mask_stack = None
+        self.error_cdf = None
+        self.background = None
+        self.canvas_pool = None
+        self.scratch = None
+        self.scratch_stack = None
+        self.sample_ys = None
+        self.sample_xs = None
+        self.sample_reference = None
+        self.sample_version = 0
+        self.sample_seed = None # entropy of the samples, set by setup
+        self.estimates_since_resample = 0
+        self.rasterizer = get_backend(config.rasterizer)
+        self.coverage_cache = CoverageCache(config.coverage_cache_bytes) if config.coverage_cache_bytes > 0 else None
 
-    def setup(self, reference_image: np.ndarray):
+    def setup(self, reference_image: np.ndarray, sample_seed: int | np.random.SeedSequence | None = None):
+        """
+        `sample_seed` seeds the pixels drawn for `estimate_batch`, usually the seed of the run.
+        Environments set up with the same seed draw the same pixels, None draws fresh entropy.
+        """
+        if not isinstance(sample_seed, np.random.SeedSequence):
+            sample_seed = np.random.SeedSequence(sample_seed)
+        self.sample_seed = sample_seed.generate_state(4).tolist()
         self.reset(reference_image)
-    
+
     def reset(self, reference_image: np.ndarray | None = None):
         if reference_image is not None:
             self.reference_image = reference_image
-        self.canvas = np.ones_like(self.reference_image)
+            self.error_cdf = None
+            self.background = None
+            self.canvas_pool = CanvasPool(reference_image.shape, reference_image.dtype)
+            self.scratch = np.empty_like(reference_image)
+            if self.config.sample_fraction is not None:
+                self.resample()
+        self.canvas = self.blank_canvas()
         self.similarity_score = 0
-    
+
+    def set_background(self, background: np.ndarray | None):
+        """
+        Use a canvas with already rendered (frozen) polygons as the starting point of every render, None for white.
+        """
+        self.background = None if background is None else background.copy()
+
+    def blank_canvas(self) -> np.ndarray:
+        """
+        Return a pooled canvas holding the background, or white.
+        """
+        canvas = self.canvas_pool.acquire()
+        if self.background is None:
+            canvas.fill(1.0)
+        else:
+            np.copyto(canvas, self.background)
+        return canvas
+
+    def copy_canvas(self, canvas: np.ndarray) -> np.ndarray:
+        copy = self.canvas_pool.acquire()
+        np.copyto(copy, canvas)
+        return copy
+
+    def render(self, polygons: list[Polygon], canvas: np.ndarray) -> np.ndarray:
+        """
+        Render polygons onto a canvas with the configured rasterizer.
+        """
+        check_normalized(polygons)
+        for polygon in polygons:
+            blend_coverage(canvas, self.polygon_coverage(polygon), polygon.color)
+        return canvas
+
+    def polygon_coverage(self, polygon: Polygon) -> PolygonCoverage:
+        """
+        Return the cropped coverage mask of a polygon with the configured rasterizer and cache.
+        """
+        return polygon_coverage(self.rasterizer, polygon.vertices, self.reference_image.shape, self.config.sample_offset, self.config.fill_rule, self.coverage_cache)
+
+    def cache_statistics(self) -> dict | None:
+        return self.coverage_cache.statistics() if self.coverage_cache is not None else None
+
     def add_polygons(self, polygons: list[Polygon]) -> tuple[float, np.ndarray]:
-        render_polygons(polygons, self.config.sample_offset, self.config.fill_rule, self.canvas)
-        similarity = similarity_score(self.canvas, self.reference_image, self.config.similarity_measure)
+        self.render(polygons, self.canvas)
+        similarity = similarity_score(self.canvas, self.reference_image, self.config.similarity_measure, out=self.scratch)
         # print(f"Similarity: {similarity}")
-        diff = similarity - self.similarity_score 
+        diff = similarity - self.similarity_score
         self.similarity_score = similarity
         return diff, self.canvas
+
+    def update_error_map(self, render: np.ndarray):
+        """
+        Store the per-pixel squared error of a render as a cumulative distribution for `sample_error_position`.
+        """
+        error = np.sum(squared_error(render, self.reference_image, self.scratch), axis=-1).ravel()
+        cdf = np.cumsum(error)
+        if cdf[-1] <= 0:
+            self.error_cdf = None
+        else:
+            self.error_cdf = cdf / cdf[-1]
+
+    def sample_error_position(self, rng: np.random.Generator) -> tuple[float, float]:
+        """
+        Sample a normalized (x, y) position with probability proportional to the current residual error.
+        Falls back to a uniform position when no error map is available.
+        """
+        if self.error_cdf is None:
+            return rng.random(), rng.random()
+        height, width = self.reference_image.shape[:2]
+        u, jitter_x, jitter_y = rng.random(3)
+        index = min(int(np.searchsorted(self.error_cdf, u, side="right")), len(self.error_cdf) - 1)
+        y, x = divmod(index, width)
+        return (x + jitter_x) / width, (y + jitter_y) / height
+
+    def reference_color_at(self, x: float, y: float) -> list[float]:
+        """
+        Return the RGB color of the reference image at a normalized (x, y) position.
+        """
+        height, width = self.reference_image.shape[:2]
+        return self.reference_image[min(int(y * height), height - 1), min(int(x * width), width - 1)].tolist()
+
+    def render_layers(self, polygons: list[Polygon]) -> list[np.ndarray]:
+        """
+        Return the canvases after rendering the first 0, 1, ..., N polygons, for incremental evaluation.
+        """
+        canvas = self.blank_canvas()
+        layers = [self.copy_canvas(canvas)]
+        for polygon in polygons:
+            self.render([polygon], canvas)
+            layers.append(self.copy_canvas(canvas))
+        return layers
+
+    def evaluate_from(self, polygons: list[Polygon], start: int, base_canvas: np.ndarray) -> tuple[float, np.ndarray]:
+        """
+        Render polygons[start:] on a copy of a canvas that already holds polygons[:start], and score it.
+        """
+        canvas = self.render(polygons[start:], self.copy_canvas(base_canvas))
+        return similarity_score(canvas, self.reference_image, self.config.similarity_measure, out=self.scratch), canvas
+
+    def coverage_mask(self, polygon: Polygon) -> np.ndarray:
+        """
+        Return a (H, W) boolean mask of the pixels covered by a single polygon.
+        """
+        mask = np.zeros(self.reference_image.shape[:2], dtype=bool)
+        coverage = self.polygon_coverage(polygon)
+        height, width = coverage.mask.shape
+        mask[coverage.top:coverage.top + height, coverage.left:coverage.left + width] = coverage.mask
+        return mask
+
+    def optimal_color(self, polygons: list[Polygon], index: int) -> list[float] | None:
+        """
+        Solve for the RGB color of polygons[index] that minimizes the MSE of the final render, keeping its alpha fixed.
+
+        The final value of a covered pixel is affine in the color c of the polygon:
+            out = T * (B * (1 - a) + a * c) + A
+        where B is the canvas beneath the polygon, T the transmittance of the layers above it and A
+        their contribution on a black canvas, so the least-squares solution is closed form.
+        Returns None when the polygon does not visibly cover any pixel.
+        """
+        polygon = polygons[index]
+        a = polygon.color[-1]
+        mask = self.coverage_mask(polygon)
+        if a <= 0 or not mask.any():
+            return None
+
+        above = polygons[index + 1:]
+        beneath = self.render(polygons[:index], self.blank_canvas())
+        transmittance = self.canvas_pool.acquire()
+        transmittance.fill(1.0)
+        self.render([Polygon(p.vertices, (0.0, 0.0, 0.0, p.color[-1])) for p in above], transmittance)
+        contribution = self.canvas_pool.acquire()
+        contribution.fill(0.0)
+        self.render(above, contribution)
+
+        gain = (transmittance * a)[mask]
+        target = (self.reference_image - transmittance * beneath * (1 - a) - contribution)[mask]
+        denominator = np.sum(gain ** 2, axis=0)
+        if not np.all(denominator > 0):
+            return None  # Fully occluded by the layers above
+        color = np.sum(gain * target, axis=0) / denominator
+        return np.clip(color, 0, 1).tolist()
+
+    def _allocate_stack(self, population_size: int):
+        """
+        (Re)allocate the canvas, scratch and coverage mask stacks, only when the population size or image shape changed.
+        """
+        shape = (population_size,) + self.reference_image.shape
+        if self.canvas_stack is None or self.canvas_stack.shape != shape or self.canvas_stack.dtype != self.reference_image.dtype:
+            self.canvas_stack = np.empty(shape, dtype=self.reference_image.dtype)
+            self.scratch_stack = np.empty(shape, dtype=self.reference_image.dtype)
+            self.mask_stack = np.empty(shape[:-1], dtype=bool)
+
+    def evaluate_batch(self, polygon_lists: list[list[Polygon]], return_renders: bool = False) -> tuple[np.ndarray, list[np.ndarray] | None]:
+        """
+        Render a whole population into a preallocated (P, H, W, 3) canvas stack and score it in one pass.
+
+        Layer i of every gene is blended into all P canvases at once, within the union of the bounding
+        boxes of the layer's polygons. Genes with fewer than i+1 polygons are left untouched for that layer. Returns the similarity of every gene (the same
+        value `add_polygons` reports on a fresh canvas) and, if requested, the renders as pooled canvases.
+        """
+        for polygons in polygon_lists:
+            check_normalized(polygons)
+        self._allocate_stack(len(polygon_lists))
+        canvases, masks, scratch = self.canvas_stack, self.mask_stack, self.scratch_stack
+        if self.background is None:
+            canvases.fill(1.0)
+        else:
+            canvases[:] = self.background
+
+        num_layers = max((len(polygons) for polygons in polygon_lists), default=0)
+        inverse_alpha = np.ones(len(polygon_lists), dtype=canvases.dtype)
+        premultiplied_rgb = np.zeros((len(polygon_lists), canvases.shape[-1]), dtype=canvases.dtype)
+        for layer in range(num_layers):
+            layer_coverages = []
+            for p, polygons in enumerate(polygon_lists):
+                if layer >= len(polygons):
+                    continue
+                coverage = self.polygon_coverage(polygons[layer])
+                if coverage.mask.size > 0:
+                    layer_coverages.append((p, polygons[layer].color, coverage))
+            if not layer_coverages:
+                continue
+
+            # Only blend the union of the bounding boxes of this layer's polygons. Wide boxes keep whole
+            # rows, which are contiguous in memory and blend faster than a strided box of almost the same size
+            top = min(coverage.top for _, _, coverage in layer_coverages)
+            left = min(coverage.left for _, _, coverage in layer_coverages)
+            bottom = max(coverage.top + coverage.mask.shape[0] for _, _, coverage in layer_coverages)
+            right = max(coverage.left + coverage.mask.shape[1] for _, _, coverage in layer_coverages)
+            if 2 * (right - left) > canvases.shape[2]:
+                left, right = 0, canvases.shape[2]
+            region_masks = masks[:, top:bottom, left:right]
+            region_canvases = canvases[:, top:bottom, left:right]
+            region_scratch = scratch[:, top:bottom, left:right]
+
+            region_masks.fill(False)
+            inverse_alpha.fill(1.0)
+            premultiplied_rgb.fill(0.0)
+            for p, color, coverage in layer_coverages:
+                a = color[-1]
+                inverse_alpha[p] = 1 - a
+                premultiplied_rgb[p] = [channel * a for channel in color[:-1]]
+                height, width = coverage.mask.shape
+                region_masks[p, coverage.top - top:coverage.top - top + height, coverage.left - left:coverage.left - left + width] = coverage.mask
+            np.multiply(region_canvases, inverse_alpha[:, None, None, None], out=region_scratch)
+            np.add(region_scratch, premultiplied_rgb[:, None, None, :], out=region_scratch)
+            np.copyto(region_canvases, region_scratch, where=region_masks[..., None])
+
+        renders = [self.copy_canvas(canvas) for canvas in canvases] if return_renders else None
+        similarities = batch_similarity_score(canvases, self.reference_image, self.config.similarity_measure, out=scratch)
+        return similarities, renders
+
+    def resample(self, version: int | None = None):
+        """
+        Draw the pixels used by `estimate_batch`, the next version of the samples by default. The pixels
+        only depend on the sample seed and the version, so other processes can draw the same ones.
+        """
+        version = self.sample_version + 1 if version is None else version
+        rng = np.random.default_rng([version, *self.sample_seed])
+        fraction = self.config.sample_fraction
+        if not 0 < fraction <= 1:
+            raise ValueError(f"Invalid sample fraction: {fraction}")
+        height, width = self.reference_image.shape[:2]
+        if self.config.sample_strategy == "random":
+            count = max(1, round(fraction * height * width))
+            ys, xs = np.divmod(rng.choice(height * width, size=count, replace=False), width)
+        elif self.config.sample_strategy == "stratified":
+            # one random pixel in every cell of a grid, cells are about 1 / fraction pixels large
+            cell = max(1, round((1 / fraction) ** 0.5))
+            cell_ys, cell_xs = np.meshgrid(np.arange(0, height, cell), np.arange(0, width, cell), indexing="ij")
+            cell_ys, cell_xs = cell_ys.ravel(), cell_xs.ravel()
+            ys = cell_ys + (rng.random(cell_ys.size) * np.minimum(cell, height - cell_ys)).astype(int)
+            xs = cell_xs + (rng.random(cell_xs.size) * np.minimum(cell, width - cell_xs)).astype(int)
+        else:
+            raise ValueError(f"Invalid sample strategy: {self.config.sample_strategy}")
+        self.sample_ys, self.sample_xs = ys, xs
+        self.sample_reference = self.reference_image[ys, xs]
+        self.sample_version = version
+        self.estimates_since_resample = 0
+
+    def rotate_samples(self):
+        """
+        Count one estimated batch, drawing new samples every `resample_every` batches.
+        """
+        if self.config.resample_every > 0 and self.estimates_since_resample >= self.config.resample_every:
+            self.resample()
+        self.estimates_since_resample += 1
+
+    def sample_coverage(self, polygon: Polygon) -> np.ndarray:
+        """
+        Return whether a polygon covers each sampled pixel, using the coverage cache.
+
+        Only the reference crossings can be tested at single pixels. With a backend that does not match
+        the reference, the samples are read from its full coverage, so estimates and exact evaluations
+        always rasterize alike.
+        """
+        offsets = self.config.sample_offset
+        if self.rasterizer.matches_reference:
+            compute = lambda: sample_coverage(polygon.vertices, self.reference_image.shape, offsets, self.config.fill_rule, self.sample_ys, self.sample_xs)
+        else:
+            compute = lambda: coverage_at(self.polygon_coverage(polygon), self.sample_ys, self.sample_xs)
+        if self.coverage_cache is None:
+            return compute()
+        key = ("samples", self.sample_version, self.rasterizer.name, self.rasterizer.cache_key(polygon.vertices), offsets.offset_x.offset, offsets.offset_y.offset, self.config.fill_rule)
+        return self.coverage_cache.get(key, compute)
+
+    def estimate_batch(self, polygon_lists: list[list[Polygon]], sample_version: int | None = None) -> np.ndarray:
+        """
+        Estimate the similarity of every gene from the sampled pixels only, rasterizing each polygon at those pixels.
+
+        The samples rotate every `resample_every` batches, unless `sample_version` selects them, which lets
+        evaluation processes use the samples of the process that counts the batches.
+        """
+        if sample_version is None:
+            self.rotate_samples()
+        elif sample_version != self.sample_version:
+            self.resample(sample_version)
+
+        ys, xs = self.sample_ys, self.sample_xs
+        base = self.background[ys, xs] if self.background is not None else np.ones_like(self.sample_reference)
+        samples = np.empty((len(polygon_lists),) + base.shape, dtype=base.dtype)
+        for p, polygons in enumerate(polygon_lists):
+            check_normalized(polygons)
+            canvas = samples[p]
+            canvas[:] = base
+            for polygon in polygons:
+                mask = self.sample_coverage(polygon)
+                a = polygon.color[-1]
+                canvas[mask] = canvas[mask] * (1 - a) + np.array([channel * a for channel in polygon.color[:-1]])
+        return batch_similarity_score(samples, self.sample_reference, self.config.similarity_measure)
@@ -0,0 +1,76 @@
+from weakref import WeakKeyDictionary
+from genetic.gene import Gene
+from genetic.rng import choose_index
+import numpy as np
+
+class AdaptiveWeights:
+    """
+    Success-rate based operator weights.
+
+    Every operator is an arm with a decayed count of trials and of successes (offspring that beat
+    their parents). The weight of an arm is its prior weight times its smoothed success rate, and
+    every arm keeps at least `min_probability` of being chosen so that it can recover later in the run.
+    """
+    def __init__(self, names: list[str], prior_weights: list[float] | None = None, decay: float = 0.99, min_probability: float = 0.02):
+        self.names = names
+        self.prior_weights = prior_weights if prior_weights is not None else [1.0] * len(names)
+        self.decay = decay
+        self.min_probability = min_probability
+        self.trials = [0.0] * len(names)
+        self.successes = [0.0] * len(names)
+        self.total_trials = [0] * len(names)
+        self.total_successes = [0] * len(names)
+        self.pending = WeakKeyDictionary()
+
+    def weights(self) -> list[float]:
+        weights = [prior * (successes + 1) / (trials + 2) for prior, successes, trials in zip(self.prior_weights, self.successes, self.trials)]
+        total = sum(weights)
+        # reserve the floor of every arm, then share the rest by weight, so the probabilities sum to one
+        floor = min(self.min_probability, 1 / len(weights))
+        return [floor + (1 - floor * len(weights)) * weight / total for weight in weights]
+
+    def choose(self, rng: np.random.Generator) -> int:
+        return choose_index(rng, self.weights(), len(self.names))
+
+    def record(self, gene: Gene, index: int):
+        """
+        Remember that an operator was applied to the gene, until its feedback arrives.
+        """
+        self.pending.setdefault(gene, []).append(index)
+
+    def feedback(self, gene: Gene, improved: bool):
+        """
+        Credit every operator applied to the gene with the outcome of its evaluation.
+        """
+        for index in self.pending.pop(gene, []):
+            for i in range(len(self.names)):
+                self.trials[i] *= self.decay
+                self.successes[i] *= self.decay
+            self.trials[index] += 1
+            self.total_trials[index] += 1
+            if improved:
+                self.successes[index] += 1
+                self.total_successes[index] += 1
+
+    def statistics(self) -> list[dict]:
+        return [
+            {
+                "operator": name,
+                "trials": total_trials,
+                "successes": total_successes,
+                "success_rate": (successes + 1) / (trials + 2),
+                "probability": probability,
+            }
+            for name, total_trials, total_successes, successes, trials, probability
+            in zip(self.names, self.total_trials, self.total_successes, self.successes, self.trials, self.weights())
+        ]
+
+    def __getstate__(self):
+        # genes awaiting feedback are only meaningful inside the running process
+        state = self.__dict__.copy()
+        del state["pending"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.pending = WeakKeyDictionary()
@@ -1,53 +1,83 @@
 from abc import ABC, abstractmethod
 from genetic.gene import Gene
-import random
+from genetic.adaptive import AdaptiveWeights
+from genetic.rng import choose_index
+import numpy as np
 
 class GeneCrossover(ABC):
     @abstractmethod
-    def crossover(self, parent1: Gene, parent2: Gene) -> Gene | None:
+    def crossover(self, parent1: Gene, parent2: Gene, rng: np.random.Generator) -> Gene | None:
         pass
 
+    def feedback(self, gene: Gene, improved: bool):
+        """
+        Called once a child gene is evaluated, with whether it beat its parents.
+        """
+        pass
+
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
 class CrossoverWithProbability(GeneCrossover):
     def __init__(self, probability: float):
         self.probability = probability
 
-    def crossover(self, parent1: Gene, parent2: Gene) -> Gene | None:
-        if random.random() < self.probability:
-            return self.crossover_func(parent1, parent2)
+    def crossover(self, parent1: Gene, parent2: Gene, rng: np.random.Generator) -> Gene | None:
+        if rng.random() < self.probability:
+            return self.crossover_func(parent1, parent2, rng)
         else:
             return None
 
 class CrossoverWithOneOf(GeneCrossover):
-    def __init__(self, crossovers: list[GeneCrossover], weights: list[int] | None = None):
+    def __init__(self, crossovers: list[GeneCrossover], weights: list[int] | None = None, adaptive: bool = False):
         self.crossovers = crossovers
         self.weights = weights
+        # with adaptive, the weights are only a prior that is re-weighted by the success rate of each crossover
+        self.adaptive_weights = AdaptiveWeights([crossover.name for crossover in crossovers], weights) if adaptive else None
+
+    def crossover(self, parent1: Gene, parent2: Gene, rng: np.random.Generator) -> Gene | None:
+        if self.adaptive_weights is None:
+            index = choose_index(rng, self.weights, len(self.crossovers))
+            return self.crossovers[index].crossover(parent1, parent2, rng)
+        index = self.adaptive_weights.choose(rng)
+        child = self.crossovers[index].crossover(parent1, parent2, rng)
+        if child is not None:
+            self.adaptive_weights.record(child, index)
+        return child
+
+    def feedback(self, gene: Gene, improved: bool):
+        if self.adaptive_weights is not None:
+            self.adaptive_weights.feedback(gene, improved)
+        for crossover in self.crossovers:
+            crossover.feedback(gene, improved)
 
-    def crossover(self, parent1: Gene, parent2: Gene) -> Gene | None:
-        crossover = random.choices(self.crossovers, weights=self.weights)[0]
-        return crossover.crossover(parent1, parent2)
+    def statistics(self) -> list[dict] | None:
+        return self.adaptive_weights.statistics() if self.adaptive_weights is not None else None
 
 class DoNothingGeneCrossover(GeneCrossover):
-    def crossover(self, parent1: Gene, _: Gene) -> Gene | None:
+    def crossover(self, parent1: Gene, _: Gene, rng: np.random.Generator) -> Gene | None:
         return None
 
 class KeepFirstParentGeneCrossover(GeneCrossover):
-    def crossover(self, parent1: Gene, _: Gene) -> Gene | None:
+    def crossover(self, parent1: Gene, _: Gene, rng: np.random.Generator) -> Gene | None:
         return parent1.copy()
 
 class KeepSecondParentGeneCrossover(GeneCrossover):
-    def crossover(self, _: Gene, parent2: Gene) -> Gene | None:
+    def crossover(self, _: Gene, parent2: Gene, rng: np.random.Generator) -> Gene | None:
         return parent2.copy()
 
 class SinglePointGeneCrossover(GeneCrossover):
-    def crossover(self, parent1: Gene, parent2: Gene) -> Gene | None:
-        new_gene = Gene()
+    def crossover(self, parent1: Gene, parent2: Gene, rng: np.random.Generator) -> Gene | None:
         short_length = min(len(parent1.polygons), len(parent2.polygons))
         long_length = max(len(parent1.polygons), len(parent2.polygons))
-        final_length = random.randint(short_length, long_length)
-        first_half = random.randint(0, final_length - 2) # the second half is at least 1
-        second_half = final_length - first_half
-        new_gene.polygons = parent1.polygons[:first_half].copy() + parent2.polygons[-second_half:].copy()
-        new_gene.colors = parent1.colors[:first_half].copy() + parent2.colors[-second_half:].copy()
+        final_length = int(rng.integers(short_length, long_length + 1))
+        # the second half is at least 1, and each half must fit in its parent when the lengths differ
+        low = max(0, final_length - len(parent2.polygons))
+        high = max(low + 1, min(len(parent1.polygons) + 1, final_length - 1))
+        first_half = int(rng.integers(low, high))
+        second_start = len(parent2.polygons) - (final_length - first_half)
+        new_gene = parent1.slice(None, first_half) + parent2.slice(second_start)
         assert len(new_gene.polygons) == final_length
         return new_gene
 
@@ -1,21 +1,163 @@
 from environment import Polygon
-import random
+from scanline import FIXED_POINT_ONE
 from typing import Self
+import numpy as np
 class Gene:
     """
     A gene is a sequence of polygons with a color.
+
+    Genes are copy-on-write: `copy` shares the polygon lists with the original, and a list is
+    only copied when one of the genes first writes to it. So `polygons` and `colors` must be
+    treated as read-only, and all changes go through `writable_polygon`, `set_polygon`,
+    `append_polygon` and `pop_polygon`. `changed` holds the indices of the polygons that
+    differ from the gene this one was copied from.
     """
-    def __init__(self, polygons: list[list[float]] = [], colors: list[list[float]] = []):
-        self.polygons = polygons
-        self.colors = colors
+    def __init__(self, polygons: list[list[float]] | None = None, colors: list[list[float]] | None = None):
+        # the gene takes ownership of the lists
+        self._polygons = polygons if polygons is not None else []
+        self._colors = colors if colors is not None else []
+        self._owns_lists = True
+        self._owned = set(range(len(self._polygons)))
+        self.changed = set()
+
+    @classmethod
+    def _shared(cls, polygons: list[list[float]], colors: list[list[float]]) -> Self:
+        gene = cls(polygons, colors)
+        gene._owned = set()
+        return gene
 
     @classmethod
-    def random_gene(cls, num_polygons: int, num_vertices: int) -> Self:
-        return cls([[random.random() for _ in range(num_vertices * 2)] for _ in range(num_polygons)],
-                    [[random.random() for _ in range(4)] for _ in range(num_polygons)])
+    def random_gene(cls, num_polygons: int, num_vertices: int, rng: np.random.Generator) -> Self:
+        return cls(rng.random((num_polygons, num_vertices * 2)).tolist(),
+                    rng.random((num_polygons, 4)).tolist())
+
+    @property
+    def polygons(self) -> list[list[float]]:
+        return self._polygons
+
+    @property
+    def colors(self) -> list[list[float]]:
+        return self._colors
 
     def as_polygons(self) -> list[Polygon]:
         return [Polygon(vertices=list(zip(*[iter(self.polygons[i])]*2)), color=self.colors[i]) for i in range(len(self.polygons))]
 
     def copy(self) -> Self:
-        return Gene(self.polygons.copy(), self.colors.copy())
+        """
+        O(1) copy sharing all polygons, neither gene owns them afterwards.
+        """
+        self._owns_lists = False
+        self._owned = set()
+        gene = Gene._shared(self._polygons, self._colors)
+        gene._owns_lists = False
+        return gene
+
+    def slice(self, start: int | None = None, stop: int | None = None) -> Self:
+        """
+        Return a gene with polygons[start:stop], sharing the polygons with this one.
+        """
+        self._owned = set()
+        return Gene._shared(self._polygons[start:stop], self._colors[start:stop])
+
+    def __add__(self, other: Self) -> Self:
+        """
+        Concatenate the polygons of two genes, sharing them with both.
+        """
+        self._owned = set()
+        other._owned = set()
+        return Gene._shared(self._polygons + other._polygons, self._colors + other._colors)
+
+    def first_changed(self) -> int:
+        """
+        Index of the first polygon that differs from the gene this one was copied from, for incremental evaluation.
+        """
+        return min(self.changed, default=len(self._polygons))
+
+    def _own_lists(self):
+        if not self._owns_lists:
+            self._polygons = list(self._polygons)
+            self._colors = list(self._colors)
+            self._owns_lists = True
+
+    def writable_polygon(self, index: int) -> tuple[list[float], list[float]]:
+        """
+        Return the vertices and color of a polygon for in-place changes, copying them if they are shared.
+        """
+        self._own_lists()
+        if index not in self._owned:
+            self._polygons[index] = self._polygons[index].copy()
+            self._colors[index] = self._colors[index].copy()
+            self._owned.add(index)
+        self.changed.add(index)
+        return self._polygons[index], self._colors[index]
+
+    def set_polygon(self, index: int, vertices: list[float] | None = None, color: list[float] | None = None):
+        """
+        Replace the vertices and/or the color of a polygon. The new lists may be shared, so they are not owned.
+        """
+        self._own_lists()
+        if vertices is not None:
+            self._polygons[index] = vertices
+        if color is not None:
+            self._colors[index] = color
+        self._owned.discard(index)
+        self.changed.add(index)
+
+    def append_polygon(self, vertices: list[float], color: list[float]):
+        self._own_lists()
+        self._polygons.append(vertices)
+        self._colors.append(color)
+        self._owned.add(len(self._polygons) - 1)
+        self.changed.add(len(self._polygons) - 1)
+
+    def pop_polygon(self, index: int):
+        self._own_lists()
+        self._polygons.pop(index)
+        self._colors.pop(index)
+        # the polygons above move down one layer
+        self._owned = {i - (i > index) for i in self._owned if i != index}
+        self.changed = {i for i in self.changed if i < index} | set(range(index, len(self._polygons)))
+
+    def quantize(self) -> "QuantizedGene":
+        return QuantizedGene.from_gene(self)
+
+class QuantizedGene:
+    """
+    A gene with all vertex coordinates stored as uint16 fixed point in [0, FIXED_POINT_ONE].
+
+    The vertices of all polygons live in one flat array, so a gene costs 2 bytes per coordinate and
+    hashing or comparing genes only looks at a few byte strings. Converting a Gene is lossless
+    within the quantization step, and converting back and forth again is exact.
+    """
+    def __init__(self, vertices: np.ndarray, lengths: tuple[int, ...], colors: np.ndarray):
+        self.vertices = vertices
+        self.lengths = lengths
+        self.colors = colors
+
+    @classmethod
+    def from_gene(cls, gene: Gene) -> Self:
+        vertices = np.array([v for polygon in gene.polygons for v in polygon], dtype=float)
+        quantized = np.round(np.clip(vertices, 0, 1) * FIXED_POINT_ONE).astype(np.uint16)
+        colors = np.array(gene.colors, dtype=float).reshape(len(gene.colors), -1)
+        return cls(quantized, tuple(len(polygon) for polygon in gene.polygons), colors)
+
+    def to_gene(self) -> Gene:
+        coordinates = (self.vertices / FIXED_POINT_ONE).tolist()
+        polygons = []
+        start = 0
+        for length in self.lengths:
+            polygons.append(coordinates[start:start + length])
+            start += length
+        return Gene(polygons, self.colors.tolist())
+
+    def as_polygons(self) -> list[Polygon]:
+        return self.to_gene().as_polygons()
+
+    def _key(self) -> tuple:
+        return self.vertices.tobytes(), self.lengths, self.colors.tobytes()
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, QuantizedGene) and self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
@@ -1,7 +1,6 @@
-import random
 from environment import PolygonEnvironment, PolygonEnvironmentConfig
 import numpy as np
-from genetic.gene import Gene
+from genetic.gene import Gene, QuantizedGene
 from genetic.mutate import (
     GeneMutator, 
     PolygonwiseGeneMutator,
@@ -12,20 +11,53 @@ from genetic.mutate import (
     ReplacePolygonGeneMutator
 )
 from genetic.crossover import GeneCrossover, SinglePointGeneCrossover, CrossoverWithOneOf, KeepFirstParentGeneCrossover, KeepSecondParentGeneCrossover
-from dataclasses import dataclass
+from genetic.rng import GaussianNoise
+from dataclasses import dataclass, field, replace
 from scanline import SampleOffset2D, FillRule
+from typing import Self
 import math
+import time
 
 class GeneInfo:
-    gene: Gene
     fitness: float | None
     render: np.ndarray | None
+    parent_fitness: float | None
+    background: Gene | None
+    quantized: QuantizedGene | None
 
-    def __init__(self, gene: Gene):
-        self.gene = gene
+    def __init__(self, gene: Gene, parent_fitness: float | None = None, background: Gene | None = None):
+        self._gene = gene
         self.fitness = None
         self.render = None
-    
+        self.parent_fitness = parent_fitness
+        self.background = background # polygons frozen into the environment background, rendered beneath gene
+        self.quantized = None
+
+    @property
+    def gene(self) -> Gene:
+        """
+        The gene, a new Gene converted back from the quantized one after `compact`.
+        """
+        if self._gene is None:
+            return self.quantized.to_gene()
+        return self._gene
+
+    def quantized_gene(self) -> QuantizedGene:
+        """
+        The gene on the fixed-point grid, only call it once the gene is no longer mutated.
+        """
+        if self.quantized is None:
+            self.quantized = self._gene.quantize()
+        return self.quantized
+
+    def compact(self):
+        """
+        Keep only the quantized gene, 2 bytes per coordinate. Lossless for a quantized rasterizer,
+        which renders the gene and its quantized version identically.
+        """
+        self.quantized_gene()
+        self._gene = None
+
     def evaluate(self, environment: PolygonEnvironment):
         if self.fitness is not None:
             return
@@ -34,14 +66,182 @@ class GeneInfo:
         self.fitness = diff
         self.render = canvas
 
-def create_initial_population(population_size: int, num_polygons: int, num_vertices: int) -> list[GeneInfo]:
-    return [GeneInfo(Gene.random_gene(num_polygons, num_vertices)) for _ in range(population_size)]
+    def full_gene(self) -> Gene:
+        """
+        Return the frozen background polygons followed by the gene's own, i.e. everything in the render.
+        """
+        if self.background is None:
+            return self.gene
+        return self.background + self.gene
+
+def evaluate_population(population: list[GeneInfo], environment: PolygonEnvironment):
+    """
+    Evaluate every gene without a fitness in a single batched render-and-score pass.
+
+    With sampled fitness, the genes only get an estimate and no render, except for the best one.
+    """
+    pending = [gene for gene in population if gene.fitness is None]
+    if not pending:
+        return
+    duplicates = []
+    if environment.rasterizer.quantized:
+        pending, duplicates = deduplicate(population, pending)
+    if environment.config.sample_fraction is not None:
+        fitnesses = environment.estimate_batch([gene.gene.as_polygons() for gene in pending])
+        for gene, fitness in zip(pending, fitnesses):
+            gene.fitness = float(fitness)
+        for gene, original in duplicates:
+            gene.fitness, gene.render = original.fitness, original.render
+        evaluate_elite(population, environment)
+        return
+    fitnesses, renders = environment.evaluate_batch([gene.gene.as_polygons() for gene in pending], return_renders=True)
+    for gene, fitness, render in zip(pending, fitnesses, renders):
+        gene.fitness = float(fitness)
+        gene.render = render
+    for gene, original in duplicates:
+        gene.fitness, gene.render = original.fitness, original.render
+
+def deduplicate(population: list[GeneInfo], pending: list[GeneInfo]) -> tuple[list[GeneInfo], list[tuple[GeneInfo, GeneInfo]]]:
+    """
+    Split the pending genes into distinct ones and (duplicate, original) pairs, where the original is an
+    evaluated or distinct gene with the same quantized gene and background, so it renders identically.
+    """
+    originals = {(gene.quantized_gene(), id(gene.background)): gene for gene in population if gene.fitness is not None}
+    distinct, duplicates = [], []
+    for gene in pending:
+        key = (gene.quantized_gene(), id(gene.background))
+        if key in originals:
+            duplicates.append((gene, originals[key]))
+        else:
+            originals[key] = gene
+            distinct.append(gene)
+    return distinct, duplicates
+
+def find_duplicate(population: list[GeneInfo], gene: GeneInfo) -> GeneInfo | None:
+    """
+    An evaluated member of the population with the same quantized gene and background as `gene`, if any.
+    """
+    key = gene.quantized_gene()
+    return next((other for other in population if other.fitness is not None and other.background is gene.background and other.quantized_gene() == key), None)
+
+def compact_population(population: list[GeneInfo], environment: PolygonEnvironment):
+    """
+    With a quantized rasterizer, keep the genes quantized between generations. Call it after
+    `report_offspring`, the operators recognize the children by their Gene.
+    """
+    if environment.rasterizer.quantized:
+        for gene in population:
+            gene.compact()
+
+def evaluate_elite(population: list[GeneInfo], environment: PolygonEnvironment) -> GeneInfo:
+    """
+    Evaluate the best gene exactly if its fitness is only an estimate (it has no render), until the best
+    gene is exact. Keeps the reported best fitness and render exact with sampled fitness.
+    """
+    while True:
+        best = max(population, key=lambda x: x.fitness)
+        if best.render is not None:
+            return best
+        fitnesses, renders = environment.evaluate_batch([best.gene.as_polygons()], return_renders=True)
+        best.fitness, best.render = float(fitnesses[0]), renders[0]
+
+def report_offspring(population: list[GeneInfo], mutator: GeneMutator, crossover: GeneCrossover):
+    """
+    Tell the operators whether each newly evaluated child beat its parents, for adaptive operator weighting.
+    """
+    for gene in population:
+        if gene.parent_fitness is None or gene.fitness is None:
+            continue
+        improved = gene.fitness > gene.parent_fitness
+        mutator.feedback(gene.gene, improved)
+        crossover.feedback(gene.gene, improved)
+        gene.parent_fitness = None
+
+def create_initial_population(population_size: int, num_polygons: int, num_vertices: int, rng: np.random.Generator) -> list[GeneInfo]:
+    return [GeneInfo(Gene.random_gene(num_polygons, num_vertices, rng)) for _ in range(population_size)]
+
+def breed(population: list[GeneInfo], population_size: int, mutator: GeneMutator, crossover: GeneCrossover, rng: np.random.Generator) -> list[GeneInfo]:
+    """
+    Create the next generation: a few selected survivors plus the elite, filled up with mutated children.
+    """
+    # Select parents
+    survivors = roulette_wheel_selection(population, population_size // 4, rng)
+    survivors.append(max(population, key=lambda x: x.fitness))
+
+    # Create next generation
+    next_generation = survivors
+    while True:
+        parents1 = roulette_wheel_selection(population, population_size // 4 * 2, rng)
+        parents2 = roulette_wheel_selection(population, population_size // 4 * 2, rng)
+        for p1, p2 in zip(parents1, parents2):
+            child_gene = crossover.crossover(p1.gene, p2.gene, rng)
+            if child_gene is not None:
+                mutator.mutate(child_gene, rng)
+                next_generation.append(GeneInfo(child_gene, parent_fitness=max(p1.fitness, p2.fitness), background=p1.background))
+                if len(next_generation) >= population_size:
+                    break
+        if len(next_generation) >= population_size:
+            break
+
+    return next_generation[:population_size]
+
+class Generation(list):
+    """
+    The population yielded by genetic_algorithm. stop_reason is set on the final one only:
+    "generations", "time_budget", "cpu_budget", "target_fitness" or "plateau".
+    """
+    def __init__(self, population: list[GeneInfo], stop_reason: str | None = None):
+        super().__init__(population)
+        self.stop_reason = stop_reason
+
+class PlateauDetector:
+    """
+    Detects when the best fitness has not improved by more than epsilon over the last `patience` updates.
+    """
+    def __init__(self, patience: int, epsilon: float):
+        self.patience = patience
+        self.epsilon = epsilon
+        self.reset()
 
-def roulette_wheel_selection(population: list[GeneInfo], selection_size: int) -> list[GeneInfo]:
+    def reset(self):
+        self.best_fitness = float('-inf')
+        self.stale = 0
+
+    def update(self, fitness: float) -> bool:
+        if fitness > self.best_fitness + self.epsilon:
+            self.best_fitness = fitness
+            self.stale = 0
+        else:
+            self.stale += 1
+        return self.stale >= self.patience
+
+def roulette_wheel_selection(population: list[GeneInfo], selection_size: int, rng: np.random.Generator) -> list[GeneInfo]:
     # weight as softmax(10 * fitness_scores)
-    weights = [math.exp(10 * gene.fitness) for gene in population]
-    selected = random.choices(population, weights=weights, k=selection_size)
-    return selected
+    weights = np.array([math.exp(10 * gene.fitness) for gene in population])
+    selected = rng.choice(len(population), size=selection_size, p=weights / weights.sum())
+    return [population[i] for i in selected]
+
+@dataclass
+class LayeringConfig:
+    """
+    Settings of the "layered" engine, which freezes converged polygons into a background canvas and keeps adding new ones.
+    """
+    freeze_count: int = 10 # polygons baked into the background at once
+    patience: int = 50 # generations without improvement before freezing
+    epsilon: float = 1e-4 # minimum fitness gain that counts as improvement
+    max_active_polygons: int = 30 # polygons evaluated on top of the background
+    add_probability: float = 0.2 # probability to add a polygon to a child
+
+@dataclass
+class SteadyStateConfig:
+    """
+    Settings of the "steady_state" engine, which evaluates children asynchronously without generations.
+    """
+    workers: int = 0 # evaluation processes, 0 evaluates in the calling process
+    in_flight: int = 0 # evaluations kept running at any time, 0 for twice the workers
+    yield_every: int = 0 # completed evaluations between yields, 0 for the population size
+    replacement: str = "worst" # "worst" or "tournament"
+    tournament_size: int = 3
 
 @dataclass
 class GeneticAlgorithmConfig:
@@ -52,6 +252,25 @@ class GeneticAlgorithmConfig:
     initial_num_vertices: int
     mutator: GeneMutator
     crossover: GeneCrossover
+    engine: str = "generational" # "generational", "hill_climbing", "layered" or "steady_state"
+    offspring_per_step: int = 8 # lambda of the (1+lambda) hill climbing engine
+    seed: int | np.random.SeedSequence | None = None # None draws fresh entropy, so the run is not reproducible
+    layering: LayeringConfig = field(default_factory=LayeringConfig)
+    steady_state: SteadyStateConfig = field(default_factory=SteadyStateConfig)
+    history_path: str | None = None # record fitness statistics and best genes to <history_path>.stats/.genes, see genetic.history
+    # stop criteria besides the number of generations, None disables them
+    time_budget: float | None = None # wall-clock seconds
+    cpu_budget: float | None = None # CPU seconds of this process
+    target_fitness: float | None = None # stop once the best fitness reaches it
+    plateau_patience: int | None = None # stop when the best fitness did not improve by plateau_epsilon in this many generations
+    plateau_epsilon: float = 1e-4
+
+    def spawn(self, count: int) -> list[Self]:
+        """
+        Return `count` copies of the config with independent seeds, one per worker or island.
+        Given the seed and the count, every copy runs bit-reproducibly.
+        """
+        return [replace(self, seed=child) for child in np.random.SeedSequence(self.seed).spawn(count)]
 
 GeneticAlgorithmConfig.DEFAULT_CONFIG = GeneticAlgorithmConfig(
     environment_config=PolygonEnvironmentConfig(
@@ -64,8 +283,8 @@ GeneticAlgorithmConfig.DEFAULT_CONFIG = GeneticAlgorithmConfig(
     initial_num_polygons=20,
     initial_num_vertices=8,
     mutator=MutateWithSomeOf([
-        PolygonwiseGeneMutator(NoisyVerticesPolygonMutation(lambda: random.gauss(0, 0.1))),
-        PolygonwiseGeneMutator(NoisyColorPolygonMutation(lambda: random.gauss(0, 0.1))),
+        PolygonwiseGeneMutator(NoisyVerticesPolygonMutation(GaussianNoise(0, 0.1))),
+        PolygonwiseGeneMutator(NoisyColorPolygonMutation(GaussianNoise(0, 0.1))),
         SwapPolygonsGeneMutator(),
         ReplacePolygonGeneMutator()
     ], repeat=2, weights=[16, 8, 2, 1]),
@@ -75,44 +294,107 @@ GeneticAlgorithmConfig.DEFAULT_CONFIG = GeneticAlgorithmConfig(
     ], weights=[1, 9])
 )
 
-def genetic_algorithm(reference_image: np.ndarray, config: GeneticAlgorithmConfig):
-    print("Starting genetic algorithm")
+def setup_engine(reference_image: np.ndarray, config: GeneticAlgorithmConfig, mutator: GeneMutator | None = None, sample_seed: int | np.random.SeedSequence | None = None) -> tuple[np.random.Generator, PolygonEnvironment]:
+    """
+    The setup shared by every engine: the generator of the run, and an environment on the reference image
+    whose pixel sampler is seeded by the run (or by `sample_seed`). Sets up `mutator`, the configured one by default.
+    """
+    rng = np.random.default_rng(config.seed)
     environment = PolygonEnvironment(config.environment_config)
-    environment.setup(reference_image)
+    environment.setup(reference_image, config.seed if sample_seed is None else sample_seed)
+    (mutator if mutator is not None else config.mutator).setup(environment)
     print("Environment setup")
+    return rng, environment
+
+def report_cache(environment: PolygonEnvironment, step: int):
+    """
+    Print the coverage cache statistics every 100 steps.
+    """
+    if environment.coverage_cache is not None and step % 100 == 0:
+        print(f"Coverage cache: {environment.cache_statistics()}")
+
+def genetic_algorithm(reference_image: np.ndarray, config: GeneticAlgorithmConfig):
+    """
+    Run the configured engine and yield its population after every generation.
+    """
+    if config.engine == "hill_climbing":
+        from genetic.hill_climbing import hill_climbing
+        generations = hill_climbing(reference_image, config)
+    elif config.engine == "layered":
+        from genetic.layered import layered_genetic_algorithm
+        generations = layered_genetic_algorithm(reference_image, config)
+    elif config.engine == "steady_state":
+        from genetic.steady_state import steady_state_genetic_algorithm
+        generations = steady_state_genetic_algorithm(reference_image, config)
+    elif config.engine == "generational":
+        generations = generational_genetic_algorithm(reference_image, config)
+    else:
+        raise ValueError(f"Invalid engine: {config.engine}")
+
+    history = None
+    if config.history_path is not None:
+        from genetic.history import RunHistory
+        history = RunHistory(config.history_path)
+    stop = StopCriteria(config)
+    try:
+        # the initial population is generation 0
+        for generation, population in enumerate(generations):
+            stop_reason = stop.check(generation, population)
+            if history is not None:
+                history.record(generation, population)
+            yield Generation(population, stop_reason)
+            if stop_reason is not None:
+                return
+    finally:
+        generations.close()
+        if history is not None:
+            history.close()
+
+class StopCriteria:
+    """
+    Evaluates the stop criteria of a config after every generation, time budgets count from construction.
+    """
+    def __init__(self, config: GeneticAlgorithmConfig):
+        self.config = config
+        self.plateau = PlateauDetector(config.plateau_patience, config.plateau_epsilon) if config.plateau_patience is not None else None
+        self.start_time = time.perf_counter()
+        self.start_cpu_time = time.process_time()
+
+    def check(self, generation: int, population: list[GeneInfo]) -> str | None:
+        config = self.config
+        best_fitness = max(gene.fitness for gene in population)
+        if config.target_fitness is not None and best_fitness >= config.target_fitness:
+            return "target_fitness"
+        if self.plateau is not None and self.plateau.update(best_fitness):
+            return "plateau"
+        if config.time_budget is not None and time.perf_counter() - self.start_time >= config.time_budget:
+            return "time_budget"
+        if config.cpu_budget is not None and time.process_time() - self.start_cpu_time >= config.cpu_budget:
+            return "cpu_budget"
+        if generation >= config.generations:
+            return "generations"
+        return None
+
+def generational_genetic_algorithm(reference_image: np.ndarray, config: GeneticAlgorithmConfig):
+    print("Starting genetic algorithm")
+    rng, environment = setup_engine(reference_image, config)
     
-    population = create_initial_population(config.population_size, config.initial_num_polygons, config.initial_num_vertices)
+    population = create_initial_population(config.population_size, config.initial_num_polygons, config.initial_num_vertices, rng)
     print("Population created")
-    for i, gene in enumerate(population):
-        print(f"Evaluating fitness {i}/{len(population)}")
-        gene.evaluate(environment)
+    print(f"Evaluating fitness of {len(population)} genes")
+    evaluate_population(population, environment)
+    compact_population(population, environment)
+    environment.update_error_map(max(population, key=lambda x: x.fitness).render)
     yield population
 
     print("Starting main loop")
     for generation in range(config.generations):
-        # Select parents
-        survivors = roulette_wheel_selection(population, config.population_size // 4)
-        survivors.append(max(population, key=lambda x: x.fitness))
-
-        # Create next generation
-        next_generation = survivors
-        while True:
-            parents1 = roulette_wheel_selection(population, config.population_size // 4 * 2)
-            parents2 = roulette_wheel_selection(population, config.population_size // 4 * 2)
-            for p1, p2 in zip(parents1, parents2):
-                child_gene = config.crossover.crossover(p1.gene, p2.gene)
-                if child_gene is not None:
-                    config.mutator.mutate(child_gene)
-                    next_generation.append(GeneInfo(child_gene))
-                    if len(next_generation) >= config.population_size:
-                        break
-            if len(next_generation) >= config.population_size:
-                break
-        
-        population = next_generation[:config.population_size]
-
-        for i, gene in enumerate(population):
-            print(f"Evaluating fitness {i}/{len(population)}")
-            gene.evaluate(environment)
+        population = breed(population, config.population_size, config.mutator, config.crossover, rng)
+
+        evaluate_population(population, environment)
+        report_offspring(population, config.mutator, config.crossover)
+        compact_population(population, environment)
+        environment.update_error_map(max(population, key=lambda x: x.fitness).render)
+        report_cache(environment, generation)
 
         yield population
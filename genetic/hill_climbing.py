@@ -0,0 +1,47 @@
+import numpy as np
+from genetic.gene import Gene
+from genetic.genetic import GeneInfo, GeneticAlgorithmConfig, evaluate_population, find_duplicate, report_cache, report_offspring, setup_engine
+
+def hill_climbing(reference_image: np.ndarray, config: GeneticAlgorithmConfig):
+    """
+    (1+lambda) evolution strategy on a single gene.
+
+    Every step creates `config.offspring_per_step` mutants of the current gene and keeps the best
+    one if it improves. Mutants are rendered on top of the cached canvas of the unchanged polygons
+    they share with the parent. With a quantized rasterizer, a mutant that renders like the parent or an
+    earlier mutant reuses its fitness. Yields [parent, *mutants] after every step, like `genetic_algorithm`.
+    """
+    print("Starting hill climbing")
+    rng, environment = setup_engine(reference_image, config)
+
+    parent = GeneInfo(Gene.random_gene(config.initial_num_polygons, config.initial_num_vertices, rng))
+    evaluate_population([parent], environment)
+    layers = environment.render_layers(parent.gene.as_polygons())
+    environment.update_error_map(parent.render)
+    yield [parent]
+
+    print("Starting main loop")
+    for step in range(config.generations):
+        offspring = []
+        for _ in range(config.offspring_per_step):
+            child = GeneInfo(parent.gene.copy(), parent_fitness=parent.fitness)
+            config.mutator.mutate(child.gene, rng)
+            duplicate = find_duplicate([parent] + offspring, child) if environment.rasterizer.quantized else None
+            if duplicate is not None:
+                # the mutation did not move any vertex off its grid position
+                child.fitness, child.render = duplicate.fitness, duplicate.render
+            else:
+                start = child.gene.first_changed()
+                fitness, child.render = environment.evaluate_from(child.gene.as_polygons(), start, layers[start])
+                child.fitness = float(fitness)
+            offspring.append(child)
+        report_offspring(offspring, config.mutator, config.crossover)
+
+        best = max(offspring, key=lambda x: x.fitness)
+        if best.fitness > parent.fitness:
+            parent = best
+            layers = environment.render_layers(parent.gene.as_polygons())
+            environment.update_error_map(parent.render)
+        report_cache(environment, step)
+
+        yield [parent] + offspring
@@ -0,0 +1,110 @@
+import numpy as np
+from environment import PolygonEnvironment
+from genetic.gene import Gene
+
+# One record per generation in <path>.stats, the best genes are packed as float64 in <path>.genes
+STATS_DTYPE = np.dtype([
+    ("generation", np.int64),
+    ("best", np.float64),
+    ("mean", np.float64),
+    ("worst", np.float64),
+    ("std", np.float64),
+    ("gene_offset", np.int64), # in float64 items
+    ("gene_size", np.int64),
+])
+
+def pack_gene(gene: Gene) -> np.ndarray:
+    """
+    Flatten a gene as [num_polygons, (num_coordinates, *coordinates, *color) for each polygon].
+    """
+    packed = [float(len(gene.polygons))]
+    for vertices, color in zip(gene.polygons, gene.colors):
+        packed.append(float(len(vertices)))
+        packed.extend(vertices)
+        packed.extend(color)
+    return np.array(packed, dtype=np.float64)
+
+def unpack_gene(packed: np.ndarray) -> Gene:
+    values = packed.tolist()
+    polygons, colors = [], []
+    position = 1
+    for _ in range(int(values[0])):
+        length = int(values[position])
+        polygons.append(values[position + 1:position + 1 + length])
+        colors.append(values[position + 1 + length:position + 5 + length])
+        position += 5 + length
+    return Gene(polygons, colors)
+
+class RunHistory:
+    """
+    Append-only record of a run: fitness statistics and the best gene of every generation.
+
+    Records go straight to disk, so memory use does not grow with the run length, and every record
+    is flushed so that a RunHistoryReader can follow a running optimization. A gene is only written
+    when the best gene changed, otherwise the record points at the previous one.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.stats_file = open(f"{path}.stats", "wb")
+        self.genes_file = open(f"{path}.genes", "wb")
+        self.gene_offset = 0
+        self.last_gene = None
+
+    def record(self, generation: int, population: list):
+        fitnesses = np.array([gene.fitness for gene in population], dtype=np.float64)
+        best = max(population, key=lambda x: x.fitness)
+        packed = pack_gene(best.full_gene())
+        if self.last_gene is None or not np.array_equal(packed, self.last_gene):
+            if self.last_gene is not None:
+                self.gene_offset += len(self.last_gene)
+            self.genes_file.write(packed.tobytes())
+            self.last_gene = packed
+        record = np.array([(generation, fitnesses.max(), fitnesses.mean(), fitnesses.min(), fitnesses.std(), self.gene_offset, len(packed))], dtype=STATS_DTYPE)
+        self.stats_file.write(record.tobytes())
+        # the gene first, so a reader never sees a record pointing past the end of the genes
+        self.flush()
+
+    def flush(self):
+        self.genes_file.flush()
+        self.stats_file.flush()
+
+    def close(self):
+        self.stats_file.close()
+        self.genes_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+class RunHistoryReader:
+    """
+    Memory-mapped view of a RunHistory, which may still be written to. `stats` is a structured array
+    with one record per generation, and any generation can be re-rendered from its stored gene.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.stats = self._map(f"{path}.stats", STATS_DTYPE)
+        self.genes = self._map(f"{path}.genes", np.dtype(np.float64))
+
+    @staticmethod
+    def _map(filename: str, dtype: np.dtype) -> np.ndarray:
+        with open(filename, "rb") as f:
+            count = f.seek(0, 2) // dtype.itemsize
+        if count == 0:
+            return np.empty(0, dtype=dtype)  # np.memmap can not map an empty file
+        return np.memmap(filename, dtype=dtype, mode="r", shape=(count,))
+
+    def __len__(self) -> int:
+        return len(self.stats)
+
+    def gene(self, index: int) -> Gene:
+        record = self.stats[index]
+        return unpack_gene(self.genes[record["gene_offset"]:record["gene_offset"] + record["gene_size"]])
+
+    def render(self, index: int, environment: PolygonEnvironment) -> np.ndarray:
+        """
+        Reproduce the best render of a generation with an environment set up on the run's reference image.
+        """
+        return environment.render(self.gene(index).as_polygons(), np.ones_like(environment.reference_image))
@@ -0,0 +1,63 @@
+import numpy as np
+from genetic.gene import Gene
+from genetic.genetic import GeneInfo, GeneticAlgorithmConfig, PlateauDetector, breed, create_initial_population, compact_population, evaluate_population, report_cache, report_offspring, setup_engine
+from genetic.mutate import AddPolygonGeneMutator, MutateWithAll, MutateWithProbability
+
+class FixedNumVertices:
+    def __init__(self, num_vertices: int):
+        self.num_vertices = num_vertices
+
+    def __call__(self, rng: np.random.Generator) -> int:
+        return self.num_vertices
+
+def layered_genetic_algorithm(reference_image: np.ndarray, config: GeneticAlgorithmConfig):
+    """
+    Generational GA that grows the polygon count by freezing converged layers.
+
+    Children get a new polygon with probability `config.layering.add_probability`. Once the best
+    fitness plateaus, the first `freeze_count` polygons of the best gene are rendered into the
+    environment background, and the population restarts from the rest of that gene. Only the
+    active polygons are evaluated, on top of the background, so the cost of an evaluation stays
+    bounded while the total polygon count keeps growing. GeneInfo.full_gene() returns all polygons.
+    """
+    print("Starting layered genetic algorithm")
+    layering = config.layering
+    mutator = MutateWithAll([
+        config.mutator,
+        MutateWithProbability(layering.add_probability, AddPolygonGeneMutator(FixedNumVertices(config.initial_num_vertices), layering.max_active_polygons)),
+    ])
+    rng, environment = setup_engine(reference_image, config, mutator)
+
+    frozen = Gene([], [])
+    population = create_initial_population(config.population_size, config.initial_num_polygons, config.initial_num_vertices, rng)
+    evaluate_population(population, environment)
+    compact_population(population, environment)
+    environment.update_error_map(max(population, key=lambda x: x.fitness).render)
+    plateau = PlateauDetector(layering.patience, layering.epsilon)
+    yield population
+
+    print("Starting main loop")
+    for generation in range(config.generations):
+        population = breed(population, config.population_size, mutator, config.crossover, rng)
+        evaluate_population(population, environment)
+        report_offspring(population, mutator, config.crossover)
+        compact_population(population, environment)
+        best = max(population, key=lambda x: x.fitness)
+        environment.update_error_map(best.render)
+
+        if plateau.update(best.fitness) and len(best.gene.polygons) > layering.freeze_count:
+            # Bake the bottom layers of the best gene into the background, keep optimizing the rest,
+            # which always holds at least one polygon
+            baked = best.gene.slice(None, layering.freeze_count)
+            environment.set_background(environment.render(baked.as_polygons(), environment.blank_canvas()))
+            frozen = frozen + baked
+            active = best.gene.slice(layering.freeze_count)
+            population = [GeneInfo(active.copy(), background=frozen) for _ in range(config.population_size)]
+            evaluate_population(population, environment)
+            compact_population(population, environment)
+            plateau.reset()
+            print(f"Generation {generation}: froze {len(frozen.polygons)} polygons, fitness {best.fitness:.4f}")
+
+        report_cache(environment, generation)
+
+        yield population
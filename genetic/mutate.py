@@ -1,148 +1,293 @@
 from genetic.gene import Gene
-from environment import Polygon
+from genetic.adaptive import AdaptiveWeights
+from environment import Polygon, PolygonEnvironment
+from genetic.rng import choose_index
 from abc import ABC, abstractmethod
-import random
 from typing import Callable
+import numpy as np
 
 def clip(value: float, min_value: float, max_value: float) -> float:
     return max(min_value, min(value, max_value))
 
 class GeneMutator(ABC):
     @abstractmethod
-    def mutate(self, gene: Gene):
+    def mutate(self, gene: Gene, rng: np.random.Generator):
         pass
 
+    def setup(self, environment: PolygonEnvironment):
+        """
+        Called once the environment of a run is set up, for mutators that need the rendering context.
+        """
+        pass
+
+    def feedback(self, gene: Gene, improved: bool):
+        """
+        Called once a mutated gene is evaluated, with whether it beat its parents.
+        """
+        pass
+
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
 # Combinators
 class MutateWithProbability(GeneMutator):
     def __init__(self, probability: float, mutator: GeneMutator):
         self.probability = probability
         self.mutator = mutator
 
-    def mutate(self, gene: Gene):
-        if random.random() < self.probability:
-            self.mutator.mutate(gene)
+    def mutate(self, gene: Gene, rng: np.random.Generator):
+        if rng.random() < self.probability:
+            self.mutator.mutate(gene, rng)
+
+    def setup(self, environment: PolygonEnvironment):
+        self.mutator.setup(environment)
+
+    def feedback(self, gene: Gene, improved: bool):
+        self.mutator.feedback(gene, improved)
 
 class MutateWithSomeOf(GeneMutator):
-    def __init__(self, mutators: list[GeneMutator], repeat: int = 1, weights: list[int] | None = None):
+    def __init__(self, mutators: list[GeneMutator], repeat: int = 1, weights: list[int] | None = None, adaptive: bool = False):
         self.mutators = mutators
         self.repeat = repeat
         self.weights = weights
+        # with adaptive, the weights are only a prior that is re-weighted by the success rate of each mutator
+        self.adaptive_weights = AdaptiveWeights([mutator.name for mutator in mutators], weights) if adaptive else None
 
-    def mutate(self, gene: Gene):
+    def mutate(self, gene: Gene, rng: np.random.Generator):
         # choose a mutator based on the weights
         for _ in range(self.repeat):
-            mutator = random.choices(self.mutators, weights=self.weights)[0]
-            mutator.mutate(gene)
+            if self.adaptive_weights is not None:
+                index = self.adaptive_weights.choose(rng)
+                self.adaptive_weights.record(gene, index)
+            else:
+                index = choose_index(rng, self.weights, len(self.mutators))
+            self.mutators[index].mutate(gene, rng)
+
+    def setup(self, environment: PolygonEnvironment):
+        for mutator in self.mutators:
+            mutator.setup(environment)
+
+    def feedback(self, gene: Gene, improved: bool):
+        if self.adaptive_weights is not None:
+            self.adaptive_weights.feedback(gene, improved)
+        for mutator in self.mutators:
+            mutator.feedback(gene, improved)
+
+    def statistics(self) -> list[dict] | None:
+        return self.adaptive_weights.statistics() if self.adaptive_weights is not None else None
 
 class MutateWithAll(GeneMutator):
     def __init__(self, mutators: list[GeneMutator]):
         self.mutators = mutators
 
-    def mutate(self, gene: Gene):
+    def mutate(self, gene: Gene, rng: np.random.Generator):
+        for mutator in self.mutators:
+            mutator.mutate(gene, rng)
+
+    def setup(self, environment: PolygonEnvironment):
         for mutator in self.mutators:
-            mutator.mutate(gene)
+            mutator.setup(environment)
+
+    def feedback(self, gene: Gene, improved: bool):
+        for mutator in self.mutators:
+            mutator.feedback(gene, improved)
 
 # Mutator that mutates a single polygon
 class PolygonwiseGeneMutator(GeneMutator):
     class PolygonMutation(ABC):
         @abstractmethod
-        def mutate_polygon(self, vertices: list[float], color: list[float]):
+        def mutate_polygon(self, vertices: list[float], color: list[float], rng: np.random.Generator):
             pass
 
     def __init__(self, mutation_method: PolygonMutation):
         self.mutation_method = mutation_method
+
+    @property
+    def name(self) -> str:
+        return type(self.mutation_method).__name__
     
-    def mutate(self, gene: Gene):
+    def mutate(self, gene: Gene, rng: np.random.Generator):
+        if len(gene.polygons) == 0:
+            return
         # find a polygon to mutate
-        polygon_index = random.randint(0, len(gene.polygons) - 1)
-        polygon = gene.polygons[polygon_index]
+        polygon_index = int(rng.integers(len(gene.polygons)))
+        vertices, color = gene.writable_polygon(polygon_index)
         # mutate the polygon
-        self.mutation_method.mutate_polygon(gene.polygons[polygon_index], gene.colors[polygon_index])
+        self.mutation_method.mutate_polygon(vertices, color, rng)
 
 # shape mutations
 class NoisyVerticesPolygonMutation(PolygonwiseGeneMutator.PolygonMutation):
-    def __init__(self, noise_source: Callable[[], float]):
+    def __init__(self, noise_source: Callable[[np.random.Generator], float]):
         self.noise_source = noise_source
 
-    def mutate_polygon(self, vertices: list[float], _: list[float]):
+    def mutate_polygon(self, vertices: list[float], _: list[float], rng: np.random.Generator):
         # add noise to a random vertex
-        index = random.randint(0, len(vertices) // 2 - 1)
+        index = int(rng.integers(len(vertices) // 2))
         for i in range(2):
-            vertices[index * 2 + i] += self.noise_source()
+            vertices[index * 2 + i] += self.noise_source(rng)
             vertices[index * 2 + i] = clip(vertices[index * 2 + i], 0, 1)
 
 class SwapVerticesPolygonMutation(PolygonwiseGeneMutator.PolygonMutation):
-    def mutate_polygon(self, vertices: list[float], _: list[float]):
+    def mutate_polygon(self, vertices: list[float], _: list[float], rng: np.random.Generator):
         # swap two random vertices
-        index1 = random.randint(0, len(vertices) // 2 - 1)
-        index2 = random.randint(0, len(vertices) // 2 - 1)
+        index1 = int(rng.integers(len(vertices) // 2))
+        index2 = int(rng.integers(len(vertices) // 2))
         vertices[index1 * 2], vertices[index2 * 2] = vertices[index2 * 2], vertices[index1 * 2]
         vertices[index1 * 2 + 1], vertices[index2 * 2 + 1] = vertices[index2 * 2 + 1], vertices[index1 * 2 + 1]
 
 class AddVertexPolygonMutation(PolygonwiseGeneMutator.PolygonMutation):
-    def mutate_polygon(self, vertices: list[float], _: list[float]):
+    def mutate_polygon(self, vertices: list[float], _: list[float], rng: np.random.Generator):
         # add a new vertex
-        new_vertex = [random.uniform(0, 1), random.uniform(0, 1)]
+        new_vertex = [rng.random(), rng.random()]
         #insert it in the middle of the polygon
-        vertices.insert(random.randint(0, len(vertices) // 2), new_vertex)
+        vertices.insert(int(rng.integers(len(vertices) // 2 + 1)), new_vertex)
 
 class RemoveVertexPolygonMutation(PolygonwiseGeneMutator.PolygonMutation):
-    def mutate_polygon(self, vertices: list[float], _: list[float]):
+    def mutate_polygon(self, vertices: list[float], _: list[float], rng: np.random.Generator):
         # remove a random vertex
         if len(vertices) > 3:
-            index = random.randint(0, len(vertices) // 2 - 1)
+            index = int(rng.integers(len(vertices) // 2))
             vertices.pop(index * 2)
             vertices.pop(index * 2)
 
 # color mutations
 class NoisyColorPolygonMutation(PolygonwiseGeneMutator.PolygonMutation):
-    def __init__(self, noise_source: Callable[[], float]):
+    def __init__(self, noise_source: Callable[[np.random.Generator], float]):
         self.noise_source = noise_source
 
-    def mutate_polygon(self, _: list[float], color: list[float]):
+    def mutate_polygon(self, _: list[float], color: list[float], rng: np.random.Generator):
         # add noise to the color
         for i in range(len(color)):
-            color[i] += self.noise_source()
+            color[i] += self.noise_source(rng)
             color[i] = clip(color[i], 0, 1)
 
 class NewColorPolygonMutation(PolygonwiseGeneMutator.PolygonMutation):
-    def mutate_polygon(self, _: list[float], color: list[float]):
+    def mutate_polygon(self, _: list[float], color: list[float], rng: np.random.Generator):
         # set a new random color
         color.clear()
-        color.extend([random.uniform(0, 1), random.uniform(0, 1), random.uniform(0, 1), random.uniform(0, 1)])
+        color.extend(rng.random(4).tolist())
+
+class OptimalColorGeneMutator(GeneMutator):
+    """
+    Re-optimize the color of a random polygon in closed form, keeping its alpha.
+    """
+    def __init__(self):
+        self.environment = None
+
+    def setup(self, environment: PolygonEnvironment):
+        self.environment = environment
+
+    def mutate(self, gene: Gene, rng: np.random.Generator):
+        if self.environment is None or len(gene.polygons) == 0:
+            return
+        index = int(rng.integers(len(gene.polygons)))
+        color = self.environment.optimal_color(gene.as_polygons(), index)
+        if color is not None:
+            gene.set_polygon(index, color=color + [gene.colors[index][-1]])
 
 class SwapPolygonsGeneMutator(GeneMutator):
-    def mutate(self, gene: Gene):
+    def mutate(self, gene: Gene, rng: np.random.Generator):
         # swap two random polygons
-        index1 = random.randint(0, len(gene.polygons) - 1)
-        index2 = random.randint(0, len(gene.polygons) - 1)
-        gene.polygons[index1], gene.polygons[index2] = gene.polygons[index2], gene.polygons[index1]
+        if len(gene.polygons) == 0:
+            return
+        index1 = int(rng.integers(len(gene.polygons)))
+        index2 = int(rng.integers(len(gene.polygons)))
+        vertices1, vertices2 = gene.polygons[index1], gene.polygons[index2]
+        gene.set_polygon(index1, vertices=vertices2)
+        gene.set_polygon(index2, vertices=vertices1)
 
 class AddPolygonGeneMutator(GeneMutator):
-    def __init__(self, num_vertices_sampler: Callable[[], int], max_polygons: int = -1):
+    def __init__(self, num_vertices_sampler: Callable[[np.random.Generator], int], max_polygons: int = -1):
         self.num_vertices_sampler = num_vertices_sampler
         self.max_polygons = max_polygons
 
-    def mutate(self, gene: Gene):
+    def mutate(self, gene: Gene, rng: np.random.Generator):
         if self.max_polygons < 0 or len(gene.polygons) < self.max_polygons:
             # add a new polygon
-            vertices = [random.uniform(0, 1) for _ in range(2 * self.num_vertices_sampler())]
-            color = [random.uniform(0, 1) for _ in range(4)]
-            gene.polygons.append(vertices)
-            gene.colors.append(color)
+            vertices = rng.random(2 * self.num_vertices_sampler(rng)).tolist()
+            color = rng.random(4).tolist()
+            gene.append_polygon(vertices, color)
 
 class RemovePolygonGeneMutator(GeneMutator):
-    def mutate(self, gene: Gene):
+    def mutate(self, gene: Gene, rng: np.random.Generator):
         # remove a random polygon
         if len(gene.polygons) > 0:
-            index = random.randint(0, len(gene.polygons) - 1)
-            gene.polygons.pop(index)
-            gene.colors.pop(index)
+            index = int(rng.integers(len(gene.polygons)))
+            gene.pop_polygon(index)
 
 class ReplacePolygonGeneMutator(GeneMutator):
-    def mutate(self, gene: Gene):
+    def mutate(self, gene: Gene, rng: np.random.Generator):
         # replace a random polygon
         if len(gene.polygons) > 0:
-            index = random.randint(0, len(gene.polygons) - 1)
-            gene.polygons[index] = [random.uniform(0, 1) for _ in range(len(gene.polygons[index]))]
-            gene.colors[index] = [random.uniform(0, 1) for _ in range(len(gene.colors[index]))]
+            index = int(rng.integers(len(gene.polygons)))
+            vertices = rng.random(len(gene.polygons[index])).tolist()
+            gene.set_polygon(index, vertices, rng.random(len(gene.colors[index])).tolist())
+
+# residual-error guided mutations
+class ErrorGuidedGeneMutator(GeneMutator):
+    """
+    Base class for mutators that place shapes where the current best render differs most from the reference.
+    """
+    def __init__(self):
+        self.environment = None
+
+    def setup(self, environment: PolygonEnvironment):
+        self.environment = environment
+
+    def sample_position(self, rng: np.random.Generator) -> tuple[float, float]:
+        if self.environment is None:
+            return rng.random(), rng.random()
+        return self.environment.sample_error_position(rng)
+
+    def sample_polygon(self, num_vertices: int, radius: float, rng: np.random.Generator) -> tuple[list[float], list[float]]:
+        # scatter the vertices around a high-error position, colored like the reference there
+        x, y = self.sample_position(rng)
+        offsets = rng.normal(0, radius, (num_vertices, 2))
+        vertices = np.clip(offsets + [x, y], 0, 1).ravel().tolist()
+        if self.environment is None:
+            rgb = rng.random(3).tolist()
+        else:
+            rgb = self.environment.reference_color_at(x, y)
+        return vertices, rgb + [rng.random()]
+
+class ErrorGuidedAddPolygonGeneMutator(ErrorGuidedGeneMutator):
+    def __init__(self, num_vertices_sampler: Callable[[np.random.Generator], int], radius: float = 0.1, max_polygons: int = -1):
+        super().__init__()
+        self.num_vertices_sampler = num_vertices_sampler
+        self.radius = radius
+        self.max_polygons = max_polygons
+
+    def mutate(self, gene: Gene, rng: np.random.Generator):
+        if self.max_polygons < 0 or len(gene.polygons) < self.max_polygons:
+            vertices, color = self.sample_polygon(self.num_vertices_sampler(rng), self.radius, rng)
+            gene.append_polygon(vertices, color)
+
+class ErrorGuidedReplacePolygonGeneMutator(ErrorGuidedGeneMutator):
+    def __init__(self, radius: float = 0.1):
+        super().__init__()
+        self.radius = radius
+
+    def mutate(self, gene: Gene, rng: np.random.Generator):
+        if len(gene.polygons) > 0:
+            index = int(rng.integers(len(gene.polygons)))
+            gene.set_polygon(index, *self.sample_polygon(len(gene.polygons[index]) // 2, self.radius, rng))
+
+class ErrorGuidedVerticesGeneMutator(ErrorGuidedGeneMutator):
+    def __init__(self, noise_source: Callable[[np.random.Generator], float]):
+        super().__init__()
+        self.noise_source = noise_source
+
+    def mutate(self, gene: Gene, rng: np.random.Generator):
+        # add noise to the vertex closest to a high-error position
+        if len(gene.polygons) == 0:
+            return
+        x, y = self.sample_position(rng)
+        _, polygon_index, vertex_index = min(
+            ((vertices[i] - x) ** 2 + (vertices[i + 1] - y) ** 2, p, i)
+            for p, vertices in enumerate(gene.polygons)
+            for i in range(0, len(vertices) - 1, 2)
+        )
+        vertices, _ = gene.writable_polygon(polygon_index)
+        for i in range(2):
+            vertices[vertex_index + i] = clip(vertices[vertex_index + i] + self.noise_source(rng), 0, 1)
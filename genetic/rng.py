@@ -0,0 +1,37 @@
+import numpy as np
+
+def choose_index(rng: np.random.Generator, weights: list[float] | None, size: int) -> int:
+    """
+    Draw an index in [0, size) with probability proportional to the weights (uniform if None).
+    """
+    if weights is None:
+        return int(rng.integers(size))
+    p = np.asarray(weights, dtype=float)
+    return int(rng.choice(size, p=p / p.sum()))
+
+class GaussianNoise:
+    """
+    Noise source drawing N(mean, sigma) samples from the generator in blocks of `block_size`,
+    so a whole generation of noise usually costs a single call into numpy.
+    The buffer is discarded when a different generator is passed in, e.g. at the start of a new run.
+    """
+    def __init__(self, mean: float, sigma: float, block_size: int = 4096):
+        self.mean = mean
+        self.sigma = sigma
+        self.block_size = block_size
+        self._rng = None
+        self._buffer = []
+
+    def __call__(self, rng: np.random.Generator) -> float:
+        if rng is not self._rng or not self._buffer:
+            self._rng = rng
+            # reversed so that pop() hands the samples out in the order they were drawn
+            self._buffer = rng.normal(self.mean, self.sigma, self.block_size)[::-1].tolist()
+        return self._buffer.pop()
+
+    def __getstate__(self):
+        # the buffer belongs to the generator of the running process
+        state = self.__dict__.copy()
+        state["_rng"] = None
+        state["_buffer"] = []
+        return state
@@ -0,0 +1,119 @@
+import multiprocessing as mp
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+import numpy as np
+from environment import PolygonEnvironment, PolygonEnvironmentConfig
+from scanline import Polygon
+from genetic.genetic import GeneInfo, GeneticAlgorithmConfig, compact_population, create_initial_population, evaluate_elite, evaluate_population, find_duplicate, report_cache, report_offspring, roulette_wheel_selection, setup_engine
+
+# Environment of an evaluation process, set up once by _init_worker
+_worker_environment = None
+
+def _init_worker(environment_config: PolygonEnvironmentConfig, reference_image: np.ndarray, sample_seed: int | np.random.SeedSequence):
+    global _worker_environment
+    _worker_environment = PolygonEnvironment(environment_config)
+    _worker_environment.setup(reference_image, sample_seed)
+
+def _evaluate(polygons: list[Polygon], sample_version: int) -> tuple[float, np.ndarray]:
+    return _evaluate_in(_worker_environment, polygons, sample_version)
+
+def _evaluate_in(environment: PolygonEnvironment, polygons: list[Polygon], sample_version: int) -> tuple[float, np.ndarray | None]:
+    if environment.config.sample_fraction is not None:
+        return float(environment.estimate_batch([polygons], sample_version)[0]), None
+    similarities, renders = environment.evaluate_batch([polygons], return_renders=True)
+    return float(similarities[0]), renders[0]
+
+def breed_child(population: list[GeneInfo], config: GeneticAlgorithmConfig, rng: np.random.Generator) -> GeneInfo:
+    while True:
+        p1, p2 = roulette_wheel_selection(population, 2, rng)
+        child_gene = config.crossover.crossover(p1.gene, p2.gene, rng)
+        if child_gene is not None:
+            config.mutator.mutate(child_gene, rng)
+            return GeneInfo(child_gene, parent_fitness=max(p1.fitness, p2.fitness))
+
+def replace_member(population: list[GeneInfo], child: GeneInfo, config: GeneticAlgorithmConfig, rng: np.random.Generator):
+    """
+    Insert an evaluated child in place of the worst member of the population, or of a random
+    tournament, if it is better.
+    """
+    if config.steady_state.replacement == "worst":
+        candidates = range(len(population))
+    elif config.steady_state.replacement == "tournament":
+        candidates = rng.choice(len(population), size=min(config.steady_state.tournament_size, len(population)), replace=False)
+    else:
+        raise ValueError(f"Invalid replacement: {config.steady_state.replacement}")
+    loser = min(candidates, key=lambda i: population[i].fitness)
+    if child.fitness > population[loser].fitness:
+        population[loser] = child
+
+def steady_state_genetic_algorithm(reference_image: np.ndarray, config: GeneticAlgorithmConfig):
+    """
+    Steady-state GA without a generational barrier.
+
+    A fixed number of children is evaluated at any time, in `steady_state.workers` processes.
+    As soon as one finishes it replaces a member of the population, and a new child is bred
+    and submitted, so a slow evaluation never stalls the others. The population is yielded
+    every `steady_state.yield_every` completed evaluations. With workers, the completion order
+    depends on timing, so runs are not reproducible even with a seed.
+    """
+    print("Starting steady-state genetic algorithm")
+    settings = config.steady_state
+    # the workers draw the same samples for a sampled fitness, so the seed must not be left to them
+    sample_seed = config.seed if config.seed is not None else np.random.SeedSequence()
+    rng, environment = setup_engine(reference_image, config, sample_seed=sample_seed)
+
+    population = create_initial_population(config.population_size, config.initial_num_polygons, config.initial_num_vertices, rng)
+    evaluate_population(population, environment)
+    compact_population(population, environment)
+    environment.update_error_map(max(population, key=lambda x: x.fitness).render)
+    yield list(population)
+
+    executor = None
+    if settings.workers > 0:
+        executor = ProcessPoolExecutor(settings.workers, mp_context=mp.get_context("spawn"), initializer=_init_worker, initargs=(config.environment_config, reference_image, sample_seed))
+    in_flight = settings.in_flight or max(1, 2 * settings.workers)
+    yield_every = settings.yield_every or config.population_size
+
+    def submit(child: GeneInfo) -> Future:
+        # every child counts as one batch of the sampled fitness, the samples only rotate here
+        if environment.rasterizer.quantized:
+            # a child that renders like a member of the population needs no evaluation
+            duplicate = find_duplicate(population, child)
+            if duplicate is not None:
+                future = Future()
+                future.set_result((duplicate.fitness, duplicate.render))
+                return future
+        if environment.config.sample_fraction is not None:
+            environment.rotate_samples()
+        if executor is not None:
+            return executor.submit(_evaluate, child.gene.as_polygons(), environment.sample_version)
+        future = Future()
+        future.set_result(_evaluate_in(environment, child.gene.as_polygons(), environment.sample_version))
+        return future
+
+    print("Starting main loop")
+    try:
+        pending = {}
+        for _ in range(in_flight):
+            child = breed_child(population, config, rng)
+            pending[submit(child)] = child
+
+        completed = 0
+        for step in range(config.generations):
+            while completed < (step + 1) * yield_every:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    child = pending.pop(future)
+                    child.fitness, child.render = future.result()
+                    report_offspring([child], config.mutator, config.crossover)
+                    compact_population([child], environment)
+                    replace_member(population, child, config, rng)
+                    completed += 1
+                    child = breed_child(population, config, rng)
+                    pending[submit(child)] = child
+
+            environment.update_error_map(evaluate_elite(population, environment).render)
+            report_cache(environment, step)
+            yield list(population)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -2,7 +2,7 @@ import sys
 import numpy as np
 from PySide6.QtWidgets import QApplication, QWidget, QLabel, QVBoxLayout, QHBoxLayout, QPushButton, QFileDialog
 from PySide6.QtGui import QPixmap, QImage
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QTimer
 from PIL import Image
 
 class ImageModel:
@@ -13,17 +13,24 @@ class ImageModel:
         self.is_started = False
         self.is_paused = False
         self.is_reference_replaced = False
+        # incremented on every change, so the view only redraws what changed
+        self.reference_version = 0
+        self.trial_version = 0
 
     def update_reference_image(self, new_reference_image: np.ndarray):
         self.reference_image = new_reference_image
         self.trial_image = new_reference_image.copy()
         self.is_reference_replaced = True
+        self.reference_version += 1
+        self.trial_version += 1
 
     def update_trial_image(self, new_trial_image: np.ndarray):
         self.trial_image = new_trial_image
+        self.trial_version += 1
 
     def update_score(self, new_score: int):
         self.score = new_score
+        self.trial_version += 1
 
     def reset(self):
         self.is_started = False
@@ -74,7 +81,13 @@ class ImageView(QWidget):
         self.pause_button.clicked.connect(self.controller.pause)
 
     def update_images(self, reference_image: QImage, trial_image: QImage):
+        self.update_reference_image(reference_image)
+        self.update_trial_image(trial_image)
+
+    def update_reference_image(self, reference_image: QImage):
         self.label_reference.setPixmap(QPixmap.fromImage(reference_image))
+
+    def update_trial_image(self, trial_image: QImage):
         self.label_trial.setPixmap(QPixmap.fromImage(trial_image))
 
     def update_score(self, score: int):
@@ -86,12 +99,45 @@ class ImageView(QWidget):
         self.pause_button.setText("Resume" if is_paused else "Pause")
 
 class ImageController:
-    def __init__(self, model: ImageModel, view: ImageView):
+    """
+    Drives the trials from a timer at a bounded rate. The timer only runs while started and not
+    paused, so the event loop is idle otherwise, and the view only redraws what changed in the model.
+    """
+    def __init__(self, model: ImageModel, view: ImageView, updates_per_second: int = 30):
         self.model = model
         self.view = view
+        self.timer = QTimer()
+        self.timer.setInterval(1000 // updates_per_second)
+        self.timer.timeout.connect(self.step)
+        self.drawn_reference_version = self.model.reference_version
+        self.drawn_trial_version = self.model.trial_version
         self.view.update_images(self.numpy_to_qimage(self.model.reference_image), self.numpy_to_qimage(self.model.trial_image))
         self.view.update_score(self.model.score)
 
+    def step(self):
+        state = self.model
+        if state.is_started and not state.is_paused:
+            new_trial_image = np.random.randint(0, 255, state.reference_image.shape, dtype=np.uint8)
+            new_score = np.random.randint(0, 100)
+            self.model.update_trial_image(new_trial_image)
+            self.model.update_score(new_score)
+        self.refresh_view()
+
+    def refresh_view(self):
+        if self.model.reference_version != self.drawn_reference_version:
+            self.view.update_reference_image(self.numpy_to_qimage(self.model.reference_image))
+            self.drawn_reference_version = self.model.reference_version
+        if self.model.trial_version != self.drawn_trial_version:
+            self.view.update_trial_image(self.numpy_to_qimage(self.model.trial_image))
+            self.view.update_score(self.model.score)
+            self.drawn_trial_version = self.model.trial_version
+
+    def update_timer(self):
+        if self.model.is_started and not self.model.is_paused:
+            self.timer.start()
+        else:
+            self.timer.stop()
+
     def numpy_to_qimage(self, array: np.ndarray) -> QImage:
         height, width, channel = array.shape
         bytes_per_line = 3 * width
@@ -104,7 +150,7 @@ class ImageController:
             new_reference_image = new_reference_image.resize((self.model.reference_image.shape[1], self.model.reference_image.shape[0]))
             new_reference_image_np = np.array(new_reference_image)
             self.model.update_reference_image(new_reference_image_np)
-            self.view.update_images(self.numpy_to_qimage(self.model.reference_image), self.numpy_to_qimage(self.model.trial_image))
+            self.refresh_view()
 
     def start(self):
         if not self.model.is_started:
@@ -113,6 +159,7 @@ class ImageController:
         else:
             self.model.reset()
         self.view.set_buttons_state(self.model.is_started, self.model.is_paused)
+        self.update_timer()
 
     def pause(self):
         if not self.model.is_paused:
@@ -120,19 +167,7 @@ class ImageController:
         else:
             self.model.is_paused = False
         self.view.set_buttons_state(self.model.is_started, self.model.is_paused)
-
-def main_loop(controller: ImageController) -> None:
-    while True:
-        state = controller.model
-        if state.is_started and not state.is_paused:
-            new_trial_image = np.random.randint(0, 255, state.reference_image.shape, dtype=np.uint8)
-            new_score = np.random.randint(0, 100)
-            controller.model.update_trial_image(new_trial_image)
-            controller.model.update_score(new_score)
-            controller.view.update_images(controller.numpy_to_qimage(controller.model.reference_image), controller.numpy_to_qimage(controller.model.trial_image))
-            controller.view.update_score(controller.model.score)
-
-        QApplication.processEvents()
+        self.update_timer()
 
 def main() -> None:
     reference_image = np.random.randint(0, 255, (100, 100, 3), dtype=np.uint8)
@@ -146,7 +181,7 @@ def main() -> None:
     view.set_controller(controller)
     view.show()
 
-    main_loop(controller)
+    sys.exit(app.exec())
 
 if __name__ == "__main__":
     main()
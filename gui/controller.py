@@ -1,16 +1,21 @@
-from PySide6.QtCore import QThread
+from PySide6.QtCore import QTimer
 from PySide6.QtWidgets import QFileDialog
 import numpy as np
 from PIL import Image
+from gui.process_worker import OptimizerProcess
 
 class GeneticController:
-    def __init__(self, model, view, genetic_function):
+    def __init__(self, model, view, config, refresh_interval_ms: int = 50):
         self.model = model
         self.view = view
-        self.genetic_function = genetic_function
-        self.worker_thread = None
+        self.config = config
         self.worker = None
 
+        # Poll the shared frame buffer of the optimizer process
+        self.refresh_timer = QTimer()
+        self.refresh_timer.setInterval(refresh_interval_ms)
+        self.refresh_timer.timeout.connect(self.on_refresh)
+
         # Connect view signals
         self.view.pauseClicked.connect(self.on_pause_clicked)
         self.view.startClicked.connect(self.on_start_clicked)
@@ -18,17 +23,17 @@ class GeneticController:
     def on_start_clicked(self):
         if self.worker:
             # Currently running, treat this as a reset
-            self._stop_genetic_thread()
             self._select_image()
-            if self.model.reference_image is not None:
-                self._start_genetic_thread()
-                self.view.set_start_button_text("Reset")
+            if self.model.reference_image is not None and not self.worker.set_reference(self.model.reference_image):
+                self._stop_genetic_process()
+                self._start_genetic_process()
+            self.view.set_start_button_text("Reset")
         else:
             # Not running, treat this as a start
             if self.model.reference_image is None:
                 self._select_image()
             if self.model.reference_image is not None:
-                self._start_genetic_thread()
+                self._start_genetic_process()
                 self.view.set_start_button_text("Reset")
 
     def on_pause_clicked(self, paused):
@@ -70,35 +75,34 @@ class GeneticController:
             self.model.set_reference_image(image_array)
             self.view.update_reference_image(image_array)
 
-    def _start_genetic_thread(self):
-        print("Starting genetic thread")
-        self.worker_thread = QThread()
-        from gui.worker import GeneticWorker
-        self.worker = GeneticWorker(self.genetic_function, self.model.reference_image)
-        self.worker.moveToThread(self.worker_thread)
+    def _start_genetic_process(self):
+        print("Starting genetic process")
+        self.worker = OptimizerProcess(self.config, self.model.reference_image)
+        self.worker.start()
+        self.refresh_timer.start()
+        print("Genetic process started")
 
-        self.worker_thread.started.connect(self.worker.run)
-        self.worker.iterationDone.connect(self.on_iteration_done)
-        self.worker.finished.connect(self.on_worker_finished)
-
-        self.worker_thread.start()
-        print("Genetic thread started")
-
-    def _stop_genetic_thread(self):
+    def _stop_genetic_process(self):
         if self.worker:
+            self.refresh_timer.stop()
             self.worker.stop()
-            self.worker_thread.quit()
-            self.worker_thread.wait()
             self.worker = None
-            self.worker_thread = None
 
-    def on_iteration_done(self, genes_list):
-        self.model.update_state(genes_list)
+    def shutdown(self):
+        self._stop_genetic_process()
+
+    def on_refresh(self):
+        frame = self.worker.latest_frame()
+        if frame is None:
+            if not self.worker.is_alive():
+                self.on_worker_finished()
+            return
+        self.model.update_frame(frame["current_fitness"], frame["current_render"], frame["best_fitness"], frame["best_render"])
         self.view.update_best_fitness(self.model.best_fitness_ever)
         self.view.update_best_image_ever(self.model.best_image_ever)
         self.view.update_current_best_image(self.model.current_best_image)
         self.view.update_current_best_fitness(self.model.current_best_fitness)
 
     def on_worker_finished(self):
-        # Worker finished running
-        pass
+        # Optimizer finished running, the last frame was already shown
+        self.refresh_timer.stop()
@@ -19,13 +19,9 @@ class GeneticModel:
         self.best_image_ever = None
         self.current_best_image = None
 
-    def update_state(self, genes_list):
-        # Find current generation best
-        max_fit = max(genes_list, key=lambda x: x.fitness)
-        self.current_best_image = max_fit.render
-        self.current_best_fitness = max_fit.fitness
-
-        # Update best image ever
-        if max_fit.fitness > self.best_fitness_ever:
-            self.best_fitness_ever = max_fit.fitness
-            self.best_image_ever = max_fit.render
+    def update_frame(self, current_fitness: float, current_image: np.ndarray, best_fitness: float, best_image: np.ndarray):
+        # Frames published by the optimizer process already track the best ever
+        self.current_best_fitness = current_fitness
+        self.current_best_image = current_image
+        self.best_fitness_ever = best_fitness
+        self.best_image_ever = best_image
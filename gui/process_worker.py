@@ -0,0 +1,183 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+# Header of the shared frame buffer, stored as float64 in front of the metadata and frames
+SEQUENCE, FRONT = range(2)
+HEADER_SIZE = 2
+# Metadata of each of the two buffers, stored as float64 after the header
+RUN, GENERATION, CURRENT_FITNESS, BEST_FITNESS = range(4)
+METADATA_SIZE = 4
+
+class FrameBuffer:
+    """
+    Double buffer of (current generation best, best ever) renders in shared memory.
+
+    The optimizer process writes the renders and their metadata into the back buffer, then flips
+    FRONT and increments SEQUENCE. The GUI copies the front buffer and discards the copy if SEQUENCE
+    moved meanwhile, since the writer may have started overwriting it. The metadata is stored per
+    buffer, so a copy never pairs the fitness of one frame with the renders of another. It includes
+    the id of the run that produced the frame, so the GUI can drop frames of a replaced reference
+    image. Neither side ever blocks the other.
+    """
+    def __init__(self, image_shape: tuple, name: str | None = None):
+        frame_shape = (2, 2) + tuple(image_shape)
+        frames_offset = (HEADER_SIZE + 2 * METADATA_SIZE) * 8
+        size = frames_offset + int(np.prod(frame_shape)) * np.dtype(np.float64).itemsize
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.header = np.ndarray((HEADER_SIZE,), dtype=np.float64, buffer=self.shm.buf)
+        self.metadata = np.ndarray((2, METADATA_SIZE), dtype=np.float64, buffer=self.shm.buf, offset=HEADER_SIZE * 8)
+        self.frames = np.ndarray(frame_shape, dtype=np.float64, buffer=self.shm.buf, offset=frames_offset)
+        if name is None:
+            self.header[:] = 0
+            self.metadata[:, RUN] = self.metadata[:, GENERATION] = 0
+            self.metadata[:, CURRENT_FITNESS] = self.metadata[:, BEST_FITNESS] = float('-inf')
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def publish(self, run: int, generation: int, current_fitness: float, current_render: np.ndarray, best_fitness: float, best_render: np.ndarray):
+        back = 1 - int(self.header[FRONT])
+        self.frames[back, 0] = current_render
+        self.frames[back, 1] = best_render
+        self.metadata[back] = (run, generation, current_fitness, best_fitness)
+        self.header[FRONT] = back
+        self.header[SEQUENCE] += 1
+
+    def read(self, last_sequence: int) -> dict | None:
+        """
+        Return a copy of the latest frame if it is newer than last_sequence and was not overwritten while copying.
+        """
+        sequence = int(self.header[SEQUENCE])
+        if sequence == last_sequence:
+            return None
+        front = int(self.header[FRONT])
+        metadata = self.metadata[front].copy()
+        frame = {
+            "sequence": sequence,
+            "run": int(metadata[RUN]),
+            "generation": int(metadata[GENERATION]),
+            "current_fitness": float(metadata[CURRENT_FITNESS]),
+            "current_render": self.frames[front, 0].copy(),
+            "best_fitness": float(metadata[BEST_FITNESS]),
+            "best_render": self.frames[front, 1].copy(),
+        }
+        if int(self.header[SEQUENCE]) != sequence:
+            return None  # torn read, a newer frame is already there
+        return frame
+
+    def close(self):
+        # drop the views before closing the mapping
+        del self.header, self.metadata, self.frames
+        self.shm.close()
+
+def run_optimizer(config, reference_image: np.ndarray, frame_buffer_name: str, control):
+    """
+    Entry point of the optimizer process: run genetic_algorithm and publish the best renders,
+    while handling "pause", "resume", "stop" and ("reference", image, run) messages from the GUI.
+    Frames are published with the id of their run, 0 for the initial reference image.
+    """
+    from genetic.genetic import genetic_algorithm
+
+    frames = FrameBuffer(reference_image.shape, name=frame_buffer_name)
+    run = 0
+    generations = genetic_algorithm(reference_image, config)
+    try:
+        paused = False
+        best_fitness_ever = float('-inf')
+        generation = 0
+        while True:
+            while paused or control.poll():
+                try:
+                    message = control.recv()
+                except EOFError:
+                    return  # the GUI went away
+                if message == "pause":
+                    paused = True
+                elif message == "resume":
+                    paused = False
+                elif message == "stop":
+                    return
+                elif message[0] == "reference":
+                    _, reference_image, run = message
+                    # release the pools and the run history of the replaced run right away
+                    generations.close()
+                    generations = genetic_algorithm(reference_image, config)
+                    best_fitness_ever = float('-inf')
+                    generation = 0
+
+            try:
+                population = next(generations)
+            except StopIteration:
+                return
+
+            current_best = max(population, key=lambda x: x.fitness)
+            if current_best.fitness > best_fitness_ever:
+                best_fitness_ever = current_best.fitness
+                best_render = current_best.render
+            frames.publish(run, generation, current_best.fitness, current_best.render, best_fitness_ever, best_render)
+            generation += 1
+    finally:
+        generations.close()
+        frames.close()
+
+class OptimizerProcess:
+    """
+    Runs the optimizer in a child process, so it never competes with the GUI for the GIL.
+    Control messages go through a pipe, renders come back through a shared FrameBuffer.
+    """
+    def __init__(self, config, reference_image: np.ndarray):
+        self.config = config
+        self.reference_shape = reference_image.shape
+        self.frames = FrameBuffer(reference_image.shape)
+        self.last_sequence = 0
+        self.run = 0
+        context = mp.get_context("spawn")
+        receiver, self.control = context.Pipe(duplex=False)
+        self.process = context.Process(target=run_optimizer, args=(config, reference_image, self.frames.name, receiver))
+
+    def start(self):
+        self.process.start()
+
+    def pause(self):
+        self.control.send("pause")
+
+    def resume(self):
+        self.control.send("resume")
+
+    def set_reference(self, reference_image: np.ndarray) -> bool:
+        """
+        Restart the optimizer on a new reference image. Returns False if the image does not fit the
+        shared frame buffer, in which case a new process is needed.
+        """
+        if reference_image.shape != self.reference_shape or not self.is_alive():
+            return False
+        self.run += 1
+        self.control.send(("reference", reference_image, self.run))
+        return True
+
+    def latest_frame(self) -> dict | None:
+        """
+        The latest frame of the current run, None if there is no new one. Frames of a replaced
+        reference image, published until the optimizer reads the new one, are dropped.
+        """
+        frame = self.frames.read(self.last_sequence)
+        if frame is None:
+            return None
+        self.last_sequence = frame["sequence"]
+        return frame if frame["run"] == self.run else None
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def stop(self, timeout: float = 2.0):
+        if self.process.is_alive():
+            self.control.send("stop")
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+        self.control.close()
+        self.frames.close()
+        self.frames.shm.unlink()
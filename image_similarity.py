@@ -1,15 +1,25 @@
 import numpy as np
 
-def rmse_similarity(image1, image2):
+def squared_error(image1, image2, out=None):
+    """
+    Return (image1 - image2) ** 2, computed in the scratch buffer `out` if given.
+    """
+    if out is None:
+        return (image1 - image2) ** 2
+    np.subtract(image1, image2, out=out)
+    return np.square(out, out=out)
+
+def rmse_similarity(image1, image2, out=None):
     """
     Calculate the RMSE-based similarity score for floating-point RGB images in the range [0, 1].
     Returns a similarity score where 1 means identical images and 0 means completely different.
+    `out` is an optional scratch buffer of the same shape, to avoid allocating temporaries.
     """
     if image1.shape != image2.shape:
         raise ValueError("Input images must have the same dimensions.")
     
     # Compute the Mean Squared Error (MSE)
-    mse = np.mean((image1 - image2) ** 2)
+    mse = np.mean(squared_error(image1, image2, out))
     
     # Normalize RMSE to [0, 1] for similarity
     max_possible_error = np.sqrt(3)  # Maximum RMSE for RGB images in [0, 1]
@@ -17,16 +27,17 @@ def rmse_similarity(image1, image2):
     similarity = 1 - (rmse / max_possible_error)
     return similarity
 
-def psnr_similarity(image1, image2):
+def psnr_similarity(image1, image2, out=None):
     """
     Calculate the PSNR-based similarity score for floating-point RGB images in the range [0, 1].
     Returns a similarity score where 1 means identical images and 0 means completely different.
+    `out` is an optional scratch buffer of the same shape, to avoid allocating temporaries.
     """
     if image1.shape != image2.shape:
         raise ValueError("Input images must have the same dimensions.")
     
     # Compute the Mean Squared Error (MSE)
-    mse = np.mean((image1 - image2) ** 2)
+    mse = np.mean(squared_error(image1, image2, out))
     
     if mse == 0:
         return 1.0  # Images are identical
@@ -40,11 +51,36 @@ def psnr_similarity(image1, image2):
     similarity = 1 - min_psnr / psnr
     return similarity
 
-def similarity_score(image1, image2, measure: str):
+def similarity_score(image1, image2, measure: str, out=None):
+    if measure == "rmse":
+        return rmse_similarity(image1, image2, out)
+    elif measure == "psnr":
+        return psnr_similarity(image1, image2, out)
+    else:
+        raise ValueError(f"Invalid similarity measure: {measure}")
+
+def batch_similarity_score(images, reference, measure: str, out=None):
+    """
+    Calculate the similarity score of every image in a (P, H, W, 3) stack against a single reference image.
+    Returns an array of P scores, identical to calling `similarity_score` on each image.
+    `out` is an optional scratch buffer shaped like the stack.
+    """
+    if images.shape[1:] != reference.shape:
+        raise ValueError("Input images must have the same dimensions.")
+    
+    # Compute the Mean Squared Error (MSE) of every image in one pass
+    mse = np.mean(squared_error(images, reference, out), axis=tuple(range(1, images.ndim)))
+    
     if measure == "rmse":
-        return rmse_similarity(image1, image2)
+        max_possible_error = np.sqrt(3)
+        return 1 - np.sqrt(mse) / max_possible_error
     elif measure == "psnr":
-        return psnr_similarity(image1, image2)
+        max_pixel_value = 1.0
+        min_psnr = np.log10(max_pixel_value / (1 / np.sqrt(3)))
+        with np.errstate(divide="ignore"):
+            psnr = np.log10(max_pixel_value / np.sqrt(mse))
+            similarity = 1 - min_psnr / psnr
+        return np.where(mse == 0, 1.0, similarity)  # Identical images score 1
     else:
         raise ValueError(f"Invalid similarity measure: {measure}")
 
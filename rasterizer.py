@@ -0,0 +1,387 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from importlib.util import find_spec
+import numpy as np
+from polygon import Polygon
+from scanline import (
+    SampleOffset2D,
+    FillRule,
+    PolygonCoverage,
+    scanline_spans,
+    fixed_point_spans,
+    scale_vertices,
+    quantize_vertices,
+    spans_to_coverage,
+    blend_coverage,
+)
+
+def edge_crossings(vertices: list[tuple[float, float]], canvas_shape: tuple, offsets: SampleOffset2D):
+    """
+    The edge setup of the scanline rasterizer, vectorized over all edges and scanlines of a polygon.
+
+    Returns (rows, current_x, active, winding): the scanlines from the first to the last one crossed,
+    the x-coordinate of every edge on each of them as a (scanline, edge) array, whether the edge
+    crosses that scanline, and the winding direction of each edge. None if no scanline is crossed.
+    The x-coordinates are accumulated scanline by scanline with np.add.accumulate, which adds in
+    the same order as the reference, so they are identical.
+    """
+    points = np.array(scale_vertices(vertices, canvas_shape), dtype=float).reshape(-1, 2)
+    x_start, y_start = points[:, 0], points[:, 1]
+    x_end, y_end = np.roll(points[:, 0], -1), np.roll(points[:, 1], -1)
+
+    # Ignore horizontal edges and orient the others from top to bottom
+    keep = y_start != y_end
+    x_start, y_start, x_end, y_end = x_start[keep], y_start[keep], x_end[keep], y_end[keep]
+    flipped = y_start > y_end
+    winding = np.where(flipped, -1, 1)
+    x_start, x_end = np.where(flipped, x_end, x_start), np.where(flipped, x_start, x_end)
+    y_start, y_end = np.where(flipped, y_end, y_start), np.where(flipped, y_start, y_end)
+
+    offset_y = offsets.offset_y.offset
+    start_index = np.floor(y_start + 1 - offset_y).astype(int)
+    end_index = np.floor(y_end + 1 - offset_y).astype(int)
+    inv_slope = (x_end - x_start) / (y_end - y_start)
+    first_x = x_start + inv_slope * ((start_index + offset_y) - y_start)
+
+    # Skip almost horizontal edges, will not be rendered anyway
+    keep = start_index != end_index
+    if not keep.any():
+        return None
+    start_index, end_index, inv_slope, first_x, winding = start_index[keep], end_index[keep], inv_slope[keep], first_x[keep], winding[keep]
+
+    min_y, max_y = start_index.min(), end_index.max()
+    rows = np.arange(min_y, max_y)
+    columns = rows[None, :]
+    increments = np.where(columns > start_index[:, None], inv_slope[:, None], 0.0)
+    increments[np.arange(len(first_x)), start_index - min_y] = first_x
+    current_x = np.add.accumulate(increments, axis=1).T
+    active = ((columns >= start_index[:, None]) & (columns < end_index[:, None])).T
+    return rows, current_x, active, winding
+
+class RasterizerBackend(ABC):
+    """
+    Turns one polygon with normalized vertices into the (y, pixel_start, pixel_end) spans it covers.
+
+    Backends with `matches_reference` must produce exactly the pixels of the reference scanline backend.
+    Backends with `quantized` only depend on the vertices rounded to the fixed-point grid, so genes can be
+    stored quantized (see genetic.gene.QuantizedGene) without changing their render.
+    """
+    name: str
+    matches_reference: bool = True
+    quantized: bool = False
+
+    @abstractmethod
+    def spans(self, vertices: list[tuple[float, float]], canvas_shape: tuple, offsets: SampleOffset2D, fill_rule: FillRule):
+        pass
+
+    def cache_key(self, vertices: list[tuple[float, float]]) -> tuple:
+        """
+        The part of the coverage cache key that identifies the shape of the polygon for this backend.
+        """
+        return tuple(vertices)
+
+    def coverage(self, vertices: list[tuple[float, float]], canvas_shape: tuple, offsets: SampleOffset2D, fill_rule: FillRule) -> PolygonCoverage:
+        return spans_to_coverage(self.spans(vertices, canvas_shape, offsets, fill_rule), canvas_shape)
+
+class ScanlineBackend(RasterizerBackend):
+    """
+    The pure-Python scanline rasterizer, the reference for every other backend.
+    """
+    name = "scanline"
+
+    def spans(self, vertices, canvas_shape, offsets, fill_rule):
+        return scanline_spans(scale_vertices(vertices, canvas_shape), offsets, fill_rule)
+
+class FixedPointBackend(RasterizerBackend):
+    """
+    Integer edge stepping on vertices quantized to 1/65535. Exact, hence not bit-identical to the float reference.
+    """
+    name = "fixed_point"
+    matches_reference = False
+    quantized = True
+
+    def spans(self, vertices, canvas_shape, offsets, fill_rule):
+        return fixed_point_spans(quantize_vertices(vertices), canvas_shape, offsets, fill_rule)
+
+    def cache_key(self, vertices):
+        return tuple(quantize_vertices(vertices))
+
+class NumpyBackend(RasterizerBackend):
+    """
+    Scanline rasterizer vectorized over all edges and scanlines of a polygon with edge_crossings.
+    The spans are identical to the reference.
+    """
+    name = "numpy"
+
+    def spans(self, vertices, canvas_shape, offsets, fill_rule):
+        crossings = edge_crossings(vertices, canvas_shape, offsets)
+        if crossings is None:
+            return []
+        rows, current_x, active, winding = crossings
+
+        # Sort the active edges of every scanline by x, inactive ones last and without winding
+        current_x = np.where(active, current_x, np.inf)
+        order = np.argsort(current_x, axis=1, kind="stable")
+        sorted_x = np.take_along_axis(current_x, order, axis=1)
+        sorted_winding = np.where(np.take_along_axis(active, order, axis=1), winding[order], 0)
+        winding_number = np.cumsum(sorted_winding, axis=1)
+        if fill_rule == FillRule.EVEN_ODD:
+            winding_number = winding_number % 2
+        is_inside = winding_number != 0
+        is_prev_inside = np.zeros_like(is_inside)
+        is_prev_inside[:, 1:] = is_inside[:, :-1]
+        is_boundary = is_inside != is_prev_inside
+
+        # Boundaries come in pairs within each scanline, in row-major order
+        boundary_rows = np.broadcast_to(rows[:, None], is_boundary.shape)[is_boundary]
+        offset_x = offsets.offset_x.offset
+        boundary_pixels = np.floor(sorted_x[is_boundary] + 1 - offset_x).astype(int)
+        ys, pixel_starts, pixel_ends = boundary_rows[0::2], boundary_pixels[0::2], boundary_pixels[1::2]
+        filled = pixel_starts < pixel_ends
+        return zip(ys[filled].tolist(), pixel_starts[filled].tolist(), pixel_ends[filled].tolist())
+
+class NumbaBackend(RasterizerBackend):
+    """
+    The reference scanline loop compiled with numba. Only registered when numba is importable,
+    and compiled on first use.
+    """
+    name = "numba"
+
+    def __init__(self):
+        self._kernel = None
+
+    def spans(self, vertices, canvas_shape, offsets, fill_rule):
+        if self._kernel is None:
+            self._kernel = _compile_numba_kernel()
+        points = np.array(scale_vertices(vertices, canvas_shape), dtype=float).reshape(-1, 2)
+        spans = self._kernel(points, offsets.offset_x.offset, offsets.offset_y.offset, fill_rule == FillRule.EVEN_ODD)
+        return map(tuple, spans.tolist())
+
+def _compile_numba_kernel():
+    import numba
+
+    @numba.njit(cache=False)
+    def scanline_kernel(points, offset_x, offset_y, even_odd):
+        n = points.shape[0]
+        x_current = np.empty(n)
+        inv_slopes = np.empty(n)
+        start_indices = np.empty(n, dtype=np.int64)
+        end_indices = np.empty(n, dtype=np.int64)
+        windings = np.empty(n, dtype=np.int64)
+        num_edges = 0
+        for i in range(n):
+            x_start, y_start = points[i, 0], points[i, 1]
+            x_end, y_end = points[(i + 1) % n, 0], points[(i + 1) % n, 1]
+            if y_start == y_end:
+                continue
+            winding = 1
+            if y_start > y_end:
+                x_start, x_end = x_end, x_start
+                y_start, y_end = y_end, y_start
+                winding = -1
+            start_index = np.int64(np.floor(y_start + 1 - offset_y))
+            end_index = np.int64(np.floor(y_end + 1 - offset_y))
+            if start_index == end_index:
+                continue
+            inv_slope = (x_end - x_start) / (y_end - y_start)
+            x_current[num_edges] = x_start + inv_slope * ((start_index + offset_y) - y_start)
+            inv_slopes[num_edges] = inv_slope
+            start_indices[num_edges] = start_index
+            end_indices[num_edges] = end_index
+            windings[num_edges] = winding
+            num_edges += 1
+
+        spans = np.empty((16, 3), dtype=np.int64)
+        num_spans = 0
+        if num_edges == 0:
+            return spans[:0]
+        min_y = start_indices[:num_edges].min()
+        max_y = end_indices[:num_edges].max()
+        active = np.empty(num_edges, dtype=np.int64)
+        for y in range(min_y, max_y):
+            # Collect the active edges and insertion sort them by x
+            num_active = 0
+            for e in range(num_edges):
+                if start_indices[e] <= y < end_indices[e]:
+                    j = num_active
+                    while j > 0 and x_current[active[j - 1]] > x_current[e]:
+                        active[j] = active[j - 1]
+                        j -= 1
+                    active[j] = e
+                    num_active += 1
+
+            winding_number = 0
+            is_prev_inside = False
+            has_start = False
+            pixel_start = 0
+            for k in range(num_active):
+                e = active[k]
+                winding_number += windings[e]
+                if even_odd:
+                    winding_number = winding_number % 2
+                is_inside = winding_number != 0
+                if is_inside != is_prev_inside:
+                    pixel = np.int64(np.floor(x_current[e] + 1 - offset_x))
+                    if not has_start:
+                        pixel_start = pixel
+                        has_start = True
+                    else:
+                        has_start = False
+                        if pixel_start < pixel:
+                            if num_spans == spans.shape[0]:
+                                grown = np.empty((2 * num_spans, 3), dtype=np.int64)
+                                grown[:num_spans] = spans
+                                spans = grown
+                            spans[num_spans, 0] = y
+                            spans[num_spans, 1] = pixel_start
+                            spans[num_spans, 2] = pixel
+                            num_spans += 1
+                is_prev_inside = is_inside
+
+            for e in range(num_edges):
+                if start_indices[e] <= y < end_indices[e]:
+                    x_current[e] += inv_slopes[e]
+        return spans[:num_spans]
+
+    return scanline_kernel
+
+def _entry_bytes(entry: PolygonCoverage | np.ndarray) -> int:
+    # sampled coverages are plain masks over the sample pixels
+    return entry.nbytes if isinstance(entry, np.ndarray) else entry.mask.nbytes
+
+class CoverageCache:
+    """
+    Bounded LRU cache of polygon coverages, keyed by the exact (or quantized) vertex coordinates,
+    the canvas size, the sample offsets, the fill rule and the rasterizer mode.
+
+    Children share most of their polygons with their parents, so most polygons of a new gene are
+    found here and only need to be blended. Eviction keeps the total mask size under `max_bytes`.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute) -> PolygonCoverage:
+        coverage = self.entries.get(key)
+        if coverage is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return coverage
+        self.misses += 1
+        coverage = compute()
+        self.entries[key] = coverage
+        self.memory_bytes += _entry_bytes(coverage)
+        while self.memory_bytes > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.memory_bytes -= _entry_bytes(evicted)
+        return coverage
+
+    def statistics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "memory_bytes": self.memory_bytes,
+        }
+
+RASTERIZER_BACKENDS: dict[str, RasterizerBackend] = {}
+
+def register_backend(backend: RasterizerBackend):
+    RASTERIZER_BACKENDS[backend.name] = backend
+
+def get_backend(name: str) -> RasterizerBackend:
+    if name not in RASTERIZER_BACKENDS:
+        raise ValueError(f"Invalid rasterizer backend: {name}, available: {', '.join(RASTERIZER_BACKENDS)}")
+    return RASTERIZER_BACKENDS[name]
+
+register_backend(ScanlineBackend())
+register_backend(FixedPointBackend())
+register_backend(NumpyBackend())
+if find_spec("numba") is not None:
+    register_backend(NumbaBackend())
+
+def polygon_coverage(backend: RasterizerBackend, vertices: list[tuple[float, float]], canvas_shape: tuple, offsets: SampleOffset2D, fill_rule: FillRule, cache: CoverageCache | None = None) -> PolygonCoverage:
+    """
+    Rasterize a polygon with normalized vertices into its cropped coverage mask, using the cache if given.
+    """
+    if cache is None:
+        return backend.coverage(vertices, canvas_shape, offsets, fill_rule)
+    key = (backend.name, backend.cache_key(vertices), canvas_shape[:2], offsets.offset_x.offset, offsets.offset_y.offset, fill_rule)
+    return cache.get(key, lambda: backend.coverage(vertices, canvas_shape, offsets, fill_rule))
+
+def sample_coverage(vertices: list[tuple[float, float]], canvas_shape: tuple, offsets: SampleOffset2D, fill_rule: FillRule, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+    """
+    Return whether a polygon covers each of the pixels (ys[i], xs[i]), testing only those pixels.
+
+    A pixel is covered if the winding number of the edge crossings at or left of it on its
+    scanline is inside by the fill rule. The crossings come from edge_crossings, so the result
+    is exactly the coverage of the reference rasterizer at those pixels.
+    """
+    covered = np.zeros(len(ys), dtype=bool)
+    crossings = edge_crossings(vertices, canvas_shape, offsets)
+    if crossings is None:
+        return covered
+    rows, current_x, active, winding = crossings
+    in_rows = (ys >= rows[0]) & (ys <= rows[-1])
+    sample_rows = ys[in_rows] - rows[0]
+    crossing_pixel = np.floor(current_x[sample_rows] + 1 - offsets.offset_x.offset)
+    left = active[sample_rows] & (crossing_pixel <= xs[in_rows, None])
+    winding_number = np.sum(np.where(left, winding[None, :], 0), axis=1)
+    if fill_rule == FillRule.EVEN_ODD:
+        winding_number = winding_number % 2
+    covered[in_rows] = winding_number != 0
+    return covered
+
+def coverage_at(coverage: PolygonCoverage, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+    """
+    Return whether a cropped coverage mask covers each of the pixels (ys[i], xs[i]).
+    """
+    height, width = coverage.mask.shape
+    rows, columns = ys - coverage.top, xs - coverage.left
+    inside = (rows >= 0) & (rows < height) & (columns >= 0) & (columns < width)
+    covered = np.zeros(len(ys), dtype=bool)
+    covered[inside] = coverage.mask[rows[inside], columns[inside]]
+    return covered
+
+def render_with_backend(backend: RasterizerBackend, polygons: list[Polygon], offsets: SampleOffset2D, fill_rule: FillRule, canvas: np.ndarray) -> np.ndarray:
+    for p in polygons:
+        blend_coverage(canvas, backend.coverage(p.vertices, canvas.shape, offsets, fill_rule), p.color)
+    return canvas
+
+def check_conformance(num_cases: int = 200, seed: int = 0):
+    """
+    Render random polygons through every backend that claims to match the reference and require identical pixels.
+    """
+    rng = np.random.default_rng(seed)
+    reference = get_backend("scanline")
+    backends = [backend for backend in RASTERIZER_BACKENDS.values() if backend.matches_reference and backend is not reference]
+    all_offsets = [SampleOffset2D.CENTER, SampleOffset2D.TOP_LEFT, SampleOffset2D.TOP_RIGHT, SampleOffset2D.BOTTOM_LEFT, SampleOffset2D.BOTTOM_RIGHT]
+    failures = []
+    for case in range(num_cases):
+        shape = (int(rng.integers(1, 80)), int(rng.integers(1, 80)), 3)
+        polygons = [
+            Polygon([tuple(v) for v in rng.random((int(rng.integers(3, 12)), 2)).tolist()], tuple(rng.random(4).tolist()))
+            for _ in range(int(rng.integers(1, 5)))
+        ]
+        if case % 4 == 0:
+            # snap vertices to the pixel grid to exercise vertices and edges on sample positions
+            polygons = [Polygon([(round(x * shape[1]) / shape[1], round(y * shape[0]) / shape[0]) for x, y in p.vertices], p.color) for p in polygons]
+        offsets = all_offsets[case % len(all_offsets)]
+        for fill_rule in FillRule:
+            expected = render_with_backend(reference, polygons, offsets, fill_rule, np.ones(shape))
+            for backend in backends:
+                actual = render_with_backend(backend, polygons, offsets, fill_rule, np.ones(shape))
+                if not np.array_equal(expected, actual):
+                    failures.append((backend.name, case, fill_rule))
+    if failures:
+        raise AssertionError(f"Backends differ from the reference: {failures}")
+    return [backend.name for backend in backends]
+
+if __name__ == "__main__":
+    checked = check_conformance()
+    print(f"Backends identical to the reference: {', '.join(checked)}")
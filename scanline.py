@@ -1,4 +1,3 @@
-import matplotlib.pyplot as plt
 from math import floor
 from enum import Enum
 from dataclasses import dataclass
@@ -75,9 +74,10 @@ class ScanLineEdge:
         """
         self.current_x += self.inv_slope * step
 
-def create_edge_table(polygon, offset):
+def create_edge_table(polygon, offset, edge_type=ScanLineEdge):
     """
     Create an edge table for the given polygon, used in the scanline fill algorithm.
+    `edge_type` is ScanLineEdge, or FixedPointEdge for integer coordinates and offset.
     """
     edge_table = {}
     num_vertices = len(polygon)
@@ -86,7 +86,7 @@ def create_edge_table(polygon, offset):
         x_end, y_end = polygon[(i + 1) % num_vertices]  # Wrap around to form edges
         if y_start == y_end:  # Ignore horizontal edges to avoid infinite inv_slope
             continue
-        edge = ScanLineEdge(x_start, y_start, x_end, y_end, offset)
+        edge = edge_type(x_start, y_start, x_end, y_end, offset)
         if edge.start_index == edge.end_index:
             # Skip almost horizontal edges, will not be rendered anyway
             continue
@@ -97,11 +97,19 @@ class FillRule(Enum):
     EVEN_ODD = 1
     NON_ZERO = 2
 
-def scanline_fill(vertices: list[tuple[float, float]], offsets: SampleOffset2D, fill_rule: FillRule, pointwise_function):
+def scanline_spans(vertices: list[tuple[float, float]], offsets: SampleOffset2D, fill_rule: FillRule):
     """
-    Perform scanline fill on a polygon defined by vertices, using the specified fill rule.
+    Yield the filled spans of a polygon as (y, pixel_start, pixel_end) tuples, using the specified fill rule.
     """
     edge_table = create_edge_table(vertices, offsets.offset_y)
+    # Convert intersections to pixel centers
+    yield from edge_table_spans(edge_table, fill_rule, lambda edge: offsets.offset_x.scanline_index(edge.current_x))
+
+def edge_table_spans(edge_table: dict, fill_rule: FillRule, pixel_index):
+    """
+    Run the active edge table over all scanlines and yield the filled spans. `pixel_index(edge)` maps the
+    intersection of an edge with the current scanline to the first pixel right of it.
+    """
     if not edge_table:
         return  # No edges to process
 
@@ -130,34 +138,152 @@ def scanline_fill(vertices: list[tuple[float, float]], offsets: SampleOffset2D,
                 winding_number = winding_number % 2
             is_inside = winding_number != 0
             if is_inside != is_prev_inside:
-                boundaries.append(edge.current_x)
+                boundaries.append(pixel_index(edge))
             is_prev_inside = is_inside
 
-        # Fill spans between pairs of intersections
+        # Emit spans between pairs of intersections
         for i in range(0, len(boundaries), 2):
-            x_start = boundaries[i]
-            x_end = boundaries[i + 1]
-
-            # Convert intersection range to pixel centers
-            pixel_start = offsets.offset_x.scanline_index(x_start)
-            pixel_end = offsets.offset_x.scanline_index(x_end)
-
-            # Add filled pixels for the current span
-            for x in range(pixel_start, pixel_end):
-                pointwise_function(x, y)
+            pixel_start = boundaries[i]
+            pixel_end = boundaries[i + 1]
+            if pixel_start < pixel_end:
+                yield y, pixel_start, pixel_end
 
         # Update current x-coordinates of edges in AET
         for edge in active_edge_table:
             edge.update_current_x()
 
-def render_polygons(polygons: list[Polygon], offsets: SampleOffset2D, fill_rule: FillRule, image: np.ndarray | tuple):
+def scanline_fill(vertices: list[tuple[float, float]], offsets: SampleOffset2D, fill_rule: FillRule, pointwise_function):
     """
-    Render a list of polygons onto an image using the scanline fill algorithm.
+    Perform scanline fill on a polygon defined by vertices, using the specified fill rule.
     """
-    # breakpoint()
+    for y, pixel_start, pixel_end in scanline_spans(vertices, offsets, fill_rule):
+        # Add filled pixels for the current span
+        for x in range(pixel_start, pixel_end):
+            pointwise_function(x, y)
+
+# Fixed-point coordinates: a normalized coordinate v in [0, 1] is stored as the integer round(v * FIXED_POINT_ONE)
+FIXED_POINT_ONE = 65535
+
+def quantize_vertices(vertices: list[tuple[float, float]]) -> list[tuple[int, int]]:
+    """
+    Quantize normalized vertices in [0, 1] to integers in [0, FIXED_POINT_ONE].
+    """
+    return [(round(v[0] * FIXED_POINT_ONE), round(v[1] * FIXED_POINT_ONE)) for v in vertices]
+
+class FixedPointEdge:
+    """
+    Integer counterpart of ScanLineEdge.
+
+    Coordinates are in units of 1/FIXED_POINT_ONE pixel. The x-coordinate of the edge on the current
+    scanline is the exact rational numerator / dy, and stepping to the next scanline is a single
+    integer addition, so span endpoints do not depend on floating-point rounding.
+    """
+    def __init__(self, x_start: int, y_start: int, x_end: int, y_end: int, offset: int):
+        if y_start == y_end:
+            raise ValueError("Should never construct horizontal edge")
+
+        # Ensure the edge is oriented from top to bottom
+        if y_start > y_end:
+            x_start, x_end = x_end, x_start
+            y_start, y_end = y_end, y_start
+            self.winding_number = -1
+        else:
+            self.winding_number = 1
+
+        self.start_index = (y_start + FIXED_POINT_ONE - offset) // FIXED_POINT_ONE
+        self.end_index = (y_end + FIXED_POINT_ONE - offset) // FIXED_POINT_ONE
+        self.dy = y_end - y_start
+        self.step = (x_end - x_start) * FIXED_POINT_ONE
+        first_scanline = self.start_index * FIXED_POINT_ONE + offset
+        self.numerator = x_start * self.dy + (x_end - x_start) * (first_scanline - y_start)
+
+    @property
+    def current_x(self) -> int:
+        """
+        The x-coordinate on the current scanline, rounded down to 1/FIXED_POINT_ONE pixel.
+        """
+        return self.numerator // self.dy
+
+    def pixel_index(self, offset: int) -> int:
+        """
+        Return the index of the first pixel whose sample position lies right of the edge.
+        """
+        return (self.numerator + (FIXED_POINT_ONE - offset) * self.dy) // (FIXED_POINT_ONE * self.dy)
+
+    def update_current_x(self):
+        """
+        Increment the x-coordinate for the next scanline.
+        """
+        self.numerator += self.step
+
+def fixed_point_spans(vertices: list[tuple[int, int]], canvas_shape: tuple, offsets: SampleOffset2D, fill_rule: FillRule):
+    """
+    Yield the filled spans of a polygon with quantized vertices as (y, pixel_start, pixel_end) tuples,
+    using integer edge stepping only.
+    """
+    canvas_h, canvas_w = canvas_shape[:2]
+    offset_x = round(offsets.offset_x.offset * FIXED_POINT_ONE)
+    offset_y = round(offsets.offset_y.offset * FIXED_POINT_ONE)
+    points = [(x * canvas_w, y * canvas_h) for x, y in vertices]
+    # Edges with the same rounded x map to the same pixel, so their order does not matter
+    edge_table = create_edge_table(points, offset_y, FixedPointEdge)
+    yield from edge_table_spans(edge_table, fill_rule, lambda edge: edge.pixel_index(offset_x))
+
+def scale_vertices(vertices: list[tuple[float, float]], canvas_shape: tuple) -> list[tuple[float, float]]:
+    """
+    Scale normalized vertices in [0, 1] to pixel coordinates of a canvas with the given shape.
+    """
+    canvas_h, canvas_w = canvas_shape[:2]
+    return [(v[0] * canvas_w, v[1] * canvas_h) for v in vertices]
+
+def check_normalized(polygons: list[Polygon]):
     if not all(0.0 <= v[0] <= 1.0 and 0.0 <= v[1] <= 1.0 for polygon in polygons for v in polygon.vertices):
         print(polygons)
         raise ValueError("Vertices should be normalized to the range [0, 1]")
+
+@dataclass
+class PolygonCoverage:
+    """
+    Pixels covered by a polygon, as a boolean mask cropped to its bounding box at (top, left).
+    """
+    top: int
+    left: int
+    mask: np.ndarray
+
+def spans_to_coverage(spans, canvas_shape: tuple) -> PolygonCoverage:
+    """
+    Convert (y, pixel_start, pixel_end) spans to a bounding-box cropped mask, clipped to the canvas.
+    """
+    canvas_h, canvas_w = canvas_shape[:2]
+    spans = [(y, max(x_start, 0), min(x_end, canvas_w)) for y, x_start, x_end in spans if 0 <= y < canvas_h]
+    spans = [(y, x_start, x_end) for y, x_start, x_end in spans if x_start < x_end]
+    if not spans:
+        return PolygonCoverage(0, 0, np.zeros((0, 0), dtype=bool))
+    top = min(y for y, _, _ in spans)
+    left = min(x_start for _, x_start, _ in spans)
+    bottom = max(y for y, _, _ in spans) + 1
+    right = max(x_end for _, _, x_end in spans)
+    mask = np.zeros((bottom - top, right - left), dtype=bool)
+    for y, x_start, x_end in spans:
+        mask[y - top, x_start - left:x_end - left] = True
+    return PolygonCoverage(top, left, mask)
+
+def blend_coverage(canvas: np.ndarray, coverage: PolygonCoverage, color: tuple[float, float, float, float]):
+    """
+    Blend a color over the pixels of the canvas covered by a polygon.
+    """
+    a = color[-1]
+    premultiplied_rgb = np.array([channel * a for channel in color[:-1]])
+    height, width = coverage.mask.shape
+    region = canvas[coverage.top:coverage.top + height, coverage.left:coverage.left + width]
+    np.copyto(region, region * (1-a) + premultiplied_rgb, where=coverage.mask[..., None])
+
+def render_polygons(polygons: list[Polygon], offsets: SampleOffset2D, fill_rule: FillRule, image: np.ndarray | tuple):
+    """
+    Render a list of polygons onto an image using the scanline fill algorithm.
+    """
+    # breakpoint()
+    check_normalized(polygons)
     
     if isinstance(image, np.ndarray):
         canvas = image
@@ -167,14 +293,7 @@ def render_polygons(polygons: list[Polygon], offsets: SampleOffset2D, fill_rule:
         raise ValueError("Invalid image argument: must be either a tuple or a numpy array")
     
     # Scale the polygons to the image size
-    canvas_w, canvas_h = canvas.shape[:2]
-    scaled_polygons = [
-        Polygon(
-            [(v[0] * canvas_h, v[1] * canvas_w) for v in p.vertices],
-            p.color
-        ) 
-        for p in polygons
-    ]
+    scaled_polygons = [Polygon(scale_vertices(p.vertices, canvas.shape), p.color) for p in polygons]
 
     def blend_with_color(color: tuple[float, float, float, float]):
         """
@@ -194,6 +313,9 @@ def render_polygons(polygons: list[Polygon], offsets: SampleOffset2D, fill_rule:
     return canvas
 
 if __name__ == "__main__":
+    # Only the demo needs matplotlib, keep it out of the import of the rasterizer
+    import matplotlib.pyplot as plt
+
     def show_image(image: np.ndarray):
         """
         Display the given image using matplotlib.
@@ -3,7 +3,7 @@ from PySide6.QtWidgets import QApplication
 from gui.model import GeneticModel
 from gui.view import GeneticView
 from gui.controller import GeneticController
-from genetic.genetic import genetic_algorithm, GeneticAlgorithmConfig
+from genetic.genetic import GeneticAlgorithmConfig
 
 # Placeholder for your actual genetic function
 def genetic(image_array):
@@ -24,7 +24,8 @@ if __name__ == "__main__":
     model = GeneticModel()
     view = GeneticView()
     config = GeneticAlgorithmConfig.DEFAULT_CONFIG
-    controller = GeneticController(model, view, lambda ref_img: genetic_algorithm(ref_img, config))
+    controller = GeneticController(model, view, config)
+    app.aboutToQuit.connect(controller.shutdown)
 
     view.show()
     sys.exit(app.exec())